@@ -0,0 +1,106 @@
+"""
+Accuracy and latency of the prompt categorizer against the labelled samples
+in fixtures/category_samples.jsonl, next to the previous first-match
+substring scan for comparison.
+
+--scale adds synthetic categories (20 keywords each) on top of the shipped
+table to show that per-call cost stays flat as the table grows.
+
+Usage (from backend/):
+    python benchmarks/bench_categorize.py [--repeat 200] [--scale 10 50 200]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from categorize import Categorizer  # noqa: E402
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "category_samples.jsonl")
+CONFIG = os.path.join(BACKEND, "categories.json")
+
+LEGACY_CATEGORIES = {
+    "marketing": ["marketing", "campaign", "audience"],
+    "business": ["strategy", "business", "revenue", "growth"],
+    "code": ["code", "api", "function", "programming", "debug"],
+    "design": ["design", "visual", "ui", "ux", "interface"],
+    "education": ["teach", "learn", "explain", "tutorial", "lesson"],
+}
+
+
+def legacy_categorize(text: str) -> str:
+    """The per-call dict + first-match substring scan this module replaced."""
+    lower_text = text.lower()
+    categories = {name: ("", keywords) for name, keywords in LEGACY_CATEGORIES.items()}
+    for category, (_, keywords) in categories.items():
+        if any(kw in lower_text for kw in keywords):
+            return category
+    return "general"
+
+
+def load_samples() -> list[dict]:
+    with open(FIXTURES, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def measure(categorize, samples: list[dict], repeat: int) -> tuple[list[str], list[float]]:
+    predictions, timings = [], []
+    for sample in samples:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            category = categorize(sample["text"])
+            timings.append(time.perf_counter() - started)
+        predictions.append(category)
+    return predictions, timings
+
+
+def report(name: str, samples: list[dict], predictions: list[str], timings: list[float], show_misses: bool = True):
+    correct = sum(p == s["category"] for p, s in zip(predictions, samples))
+    timings_us = sorted(t * 1e6 for t in timings)
+    p99 = timings_us[min(len(timings_us) - 1, int(len(timings_us) * 0.99))]
+    print(f"{name:<18} accuracy={correct}/{len(samples)} ({correct / len(samples):.1%})  "
+          f"p50={statistics.median(timings_us):,.1f}us  p99={p99:,.1f}us")
+    if show_misses:
+        for p, s in zip(predictions, samples):
+            if p != s["category"]:
+                print(f"       miss: expected {s['category']}, got {p}: {s['text'][:60]}")
+
+
+def scaled_config(extra_categories: int) -> dict:
+    with open(CONFIG, encoding="utf-8") as f:
+        config = json.load(f)
+    for i in range(extra_categories):
+        config["categories"][f"synthetic{i}"] = {
+            "hint": f"Synthetic category {i}.",
+            "keywords": [f"zq{i}term{j}*" if j % 2 else f"zq{i} phrase {j}" for j in range(20)],
+        }
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="timing repetitions per sample")
+    parser.add_argument("--scale", type=int, nargs="*", default=[10, 50, 200],
+                        help="extra synthetic categories to benchmark with")
+    args = parser.parse_args()
+
+    samples = load_samples()
+    report("legacy", samples, *measure(legacy_categorize, samples, args.repeat))
+
+    categorizer = Categorizer.from_file(CONFIG)
+    print(f"compiled: {len(categorizer.hints)} categories, {len(categorizer.keywords)} keywords")
+    report("compiled", samples, *measure(lambda t: categorizer.categorize(t)[0], samples, args.repeat))
+
+    for extra in args.scale:
+        config = scaled_config(extra)
+        started = time.perf_counter()
+        scaled = Categorizer(config["categories"], config["default"])
+        build_ms = (time.perf_counter() - started) * 1000
+        predictions, timings = measure(lambda t: scaled.categorize(t)[0], samples, args.repeat)
+        report(f"+{extra} categories", samples, predictions, timings, show_misses=False)
+        print(f"       {len(scaled.keywords)} keywords, compiled in {build_ms:,.1f}ms")
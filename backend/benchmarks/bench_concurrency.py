@@ -0,0 +1,117 @@
+"""
+Throughput vs. concurrency for /refine against a simulated upstream.
+
+The OpenAI client is pointed at an in-process mock transport that sleeps
+for a fixed latency before answering, so the numbers show how many
+refinements one worker can keep in flight, not how fast OpenAI is.
+
+Usage (from backend/):
+    python benchmarks/bench_concurrency.py --latency 0.5 --levels 1 10 50 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+# Every request must reach the simulated upstream: no shared backend, and no
+# response cache, near-duplicate reuse or coalescing to answer it early. The
+# upstream limiter is off too, or the higher levels are shed with 503s.
+os.environ["STORAGE_BACKEND"] = "memory"
+for flag in ("CACHE_REFINE", "NEAR_DUPLICATE_ENABLED", "COALESCE_ENABLED", "UPSTREAM_LIMIT_ENABLED"):
+    os.environ[flag] = "false"
+
+import main  # noqa: E402
+import logging  # noqa: E402
+from openai import AsyncOpenAI  # noqa: E402
+
+REFINE_BODY = {
+    "before": "write a marketing email",
+    "after": "Role & Perspective:\n\nAct as a senior marketing strategist.",
+    "why": "Added role, objective and deliverables.",
+    "language": "en",
+}
+QUESTIONS_BODY = {"questions": ["Who is this for?", "What is the goal?", "Any limits?"]}
+
+
+def make_upstream(latency: float, counter: dict) -> httpx.AsyncBaseTransport:
+    """Fake chat-completions endpoint that answers after `latency` seconds."""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        counter["calls"] += 1
+        await asyncio.sleep(latency)
+        payload = json.loads(request.content)
+        system = payload["messages"][0]["content"]
+        if "Detect the language" in system:
+            content = "en"
+        elif "Context Mirror" in system:
+            content = json.dumps(QUESTIONS_BODY)
+        else:
+            content = json.dumps(REFINE_BODY)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload["model"],
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+        })
+
+    return httpx.MockTransport(handler)
+
+
+async def run_level(concurrency: int, total: int) -> dict:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(i)
+
+        latencies = []
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                sent = time.perf_counter()
+                r = await http.post("/refine", json={"text": f"write a marketing email number {i}"})
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - sent)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"concurrency": concurrency, "requests": total, "seconds": round(elapsed, 3),
+            "rps": round(total / elapsed, 1), "p50": round(statistics.median(latencies), 3)}
+
+
+async def main_async(args):
+    logging.disable(logging.INFO)
+    counter = {"calls": 0}
+    main.client = AsyncOpenAI(
+        api_key="sk-benchmark",
+        base_url="http://upstream/v1",
+        http_client=httpx.AsyncClient(transport=make_upstream(args.latency, counter)),
+    )
+    print(f"Simulated upstream latency: {args.latency}s per call")
+    for level in args.levels:
+        result = await run_level(level, max(level * args.rounds, level))
+        print(f"concurrency={result['concurrency']:>4}  requests={result['requests']:>5}  "
+              f"time={result['seconds']:>7}s  throughput={result['rps']:>8} req/s  p50={result['p50']}s")
+    print(f"Upstream calls: {counter['calls']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated upstream latency (s)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--rounds", type=int, default=3, help="requests per concurrent client")
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,73 @@
+"""
+Latency and throughput of the feedback path against a chosen storage backend.
+
+Defaults to the in-process "memory" backend so it needs no outside service;
+pass --backend redis (with REDIS_URL) or --backend upstash to measure a real
+store. Each client alternates POST /feedback and GET /feedback/global-avg.
+
+Usage (from backend/):
+    python benchmarks/bench_feedback.py --backend memory --levels 1 10 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+
+async def run_level(app, concurrency: int, per_client: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def worker(n: int):
+            for i in range(per_client):
+                sent = time.perf_counter()
+                if i % 2 == 0:
+                    r = await http.post("/feedback", json={"prompt_id": f"bench-{n}-{i}", "rating": 1 + i % 5})
+                else:
+                    r = await http.get("/feedback/global-avg")
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - sent)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+    }
+
+
+async def main_async(args):
+    os.environ["STORAGE_BACKEND"] = args.backend
+    import main
+
+    logging.disable(logging.INFO)
+    print(f"Storage backend: {main.storage.name}")
+    try:
+        for level in args.levels:
+            r = await run_level(main.app, level, args.per_client)
+            print(f"concurrency={r['concurrency']:>4}  requests={r['requests']:>5}  "
+                  f"throughput={r['rps']:>8} req/s  p50={r['p50_ms']}ms  p99={r['p99_ms']}ms")
+    finally:
+        await main.storage.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="memory", choices=["memory", "redis", "upstash"])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--per-client", type=int, default=200)
+    asyncio.run(main_async(parser.parse_args()))
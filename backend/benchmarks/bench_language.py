@@ -0,0 +1,81 @@
+"""
+Accuracy and latency of the local language detector against the labelled
+samples in fixtures/language_samples.jsonl.
+
+Pass --llm to run the model-based detect_language_llm over the same samples
+for comparison (needs a real OPENAI_API_KEY and spends one completion per
+sample).
+
+Usage (from backend/):
+    python benchmarks/bench_language.py [--llm] [--threshold 0.8]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from language import detect  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "language_samples.jsonl")
+
+
+def load_samples() -> list[dict]:
+    with open(FIXTURES, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def report(name: str, samples: list[dict], predictions: list[str], timings: list[float]):
+    correct = sum(p == s["language"] for p, s in zip(predictions, samples))
+    timings_us = sorted(t * 1e6 for t in timings)
+    p99 = timings_us[min(len(timings_us) - 1, int(len(timings_us) * 0.99))]
+    print(f"{name:<6} accuracy={correct}/{len(samples)} ({correct / len(samples):.1%})  "
+          f"p50={statistics.median(timings_us):,.1f}us  p99={p99:,.1f}us")
+    for p, s in zip(predictions, samples):
+        if p != s["language"]:
+            print(f"       miss: expected {s['language']}, got {p}: {s['text'][:60]}")
+
+
+def bench_local(samples: list[dict], threshold: float, repeat: int):
+    predictions, timings, unsure = [], [], 0
+    for sample in samples:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            code, confidence = detect(sample["text"])
+            timings.append(time.perf_counter() - started)
+        predictions.append(code)
+        unsure += confidence < threshold
+    report("local", samples, predictions, timings)
+    confident = [(p, s) for p, s in zip(predictions, samples)
+                 if detect(s["text"])[1] >= threshold]
+    confident_correct = sum(p == s["language"] for p, s in confident)
+    print(f"       {unsure} of {len(samples)} below confidence {threshold} would go to the model; "
+          f"accuracy above it {confident_correct}/{len(confident)}")
+
+
+async def bench_llm(samples: list[dict]):
+    import main
+
+    predictions, timings = [], []
+    for sample in samples:
+        started = time.perf_counter()
+        predictions.append(await main.detect_language_llm(sample["text"]))
+        timings.append(time.perf_counter() - started)
+    report("llm", samples, predictions, timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm", action="store_true", help="also benchmark the model-based detector")
+    parser.add_argument("--threshold", type=float, default=0.8, help="confidence below which the model is asked")
+    parser.add_argument("--repeat", type=int, default=100, help="timing repetitions per sample")
+    args = parser.parse_args()
+
+    samples = load_samples()
+    bench_local(samples, args.threshold, args.repeat)
+    if args.llm:
+        asyncio.run(bench_llm(samples))
@@ -0,0 +1,150 @@
+"""
+Time-to-first-byte of the SSE endpoints versus the blocking ones.
+
+Runs the app under a real uvicorn server (the in-process ASGI transport
+buffers whole responses, which would hide streaming) with the OpenAI client
+pointed at a mock upstream that emits the JSON answer in small chunks:
+`--first-token` seconds before the first chunk, `--chunk-delay` between the
+rest. Caching is disabled so every request reaches the upstream.
+
+Usage (from backend/):
+    python benchmarks/bench_stream.py --requests 20 --first-token 0.3 --chunk-delay 0.01
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["CACHE_REFINE"] = "false"
+os.environ["CACHE_ENHANCE"] = "false"
+os.environ["NEAR_DUPLICATE_ENABLED"] = "false"
+
+import main  # noqa: E402
+import uvicorn  # noqa: E402
+from openai import AsyncOpenAI  # noqa: E402
+
+ANSWER = {
+    "before": "write a marketing email for our new running shoes",
+    "after": "Role & Perspective:\n\nAct as a senior marketing strategist. " * 12,
+    "why": "Added role, objective, deliverables and constraints.",
+}
+QUESTIONS = {"questions": ["Who is this for?", "What is the goal?", "Any limits?"]}
+
+
+def make_upstream(first_token: float, chunk_delay: float, chunk_size: int = 8) -> httpx.MockTransport:
+    """Chat-completions mock that streams when asked to."""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/models"):
+            return httpx.Response(200, json={"object": "list", "data": []})
+        payload = json.loads(request.content)
+        is_reflection = "Context Mirror" in payload["messages"][0]["content"]
+        content = json.dumps(QUESTIONS if is_reflection else ANSWER)
+
+        if not payload.get("stream"):
+            await asyncio.sleep(first_token + chunk_delay * len(content) / chunk_size)
+            return httpx.Response(200, json={
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                "model": payload["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+            })
+
+        async def chunks():
+            await asyncio.sleep(first_token)
+            for i in range(0, len(content), chunk_size):
+                chunk = {
+                    "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": payload["model"],
+                    "choices": [{"index": 0, "finish_reason": None,
+                                 "delta": {"content": content[i:i + chunk_size]}}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n".encode()
+                await asyncio.sleep(chunk_delay)
+            yield b"data: [DONE]\n\n"
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=chunks())
+
+    return httpx.MockTransport(handler)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def measure_blocking(http: httpx.AsyncClient, path: str, body: dict) -> dict:
+    started = time.perf_counter()
+    r = await http.post(path, json=body)
+    r.raise_for_status()
+    total = time.perf_counter() - started
+    return {"ttfb": total, "first_delta": total, "total": total}
+
+
+async def measure_stream(http: httpx.AsyncClient, path: str, body: dict) -> dict:
+    started = time.perf_counter()
+    ttfb = first_delta = None
+    async with http.stream("POST", path, json=body) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            now = time.perf_counter() - started
+            ttfb = ttfb if ttfb is not None else now
+            if first_delta is None and line == "event: delta":
+                first_delta = now
+    return {"ttfb": ttfb, "first_delta": first_delta, "total": time.perf_counter() - started}
+
+
+def summarize(name: str, samples: list[dict]):
+    row = {k: round(statistics.median(s[k] for s in samples) * 1000, 1) for k in ("ttfb", "first_delta", "total")}
+    print(f"{name:<16} p50 ttfb={row['ttfb']:>7}ms  first text={row['first_delta']:>7}ms  total={row['total']:>7}ms")
+
+
+async def main_async(args):
+    logging.disable(logging.INFO)
+    main.client = AsyncOpenAI(
+        api_key="sk-benchmark",
+        base_url="http://upstream/v1",
+        http_client=httpx.AsyncClient(transport=make_upstream(args.first_token, args.chunk_delay)),
+    )
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+            raise RuntimeError("uvicorn exited during startup")
+        await asyncio.sleep(0.01)
+
+    refine_body = {"text": "write a marketing email for our new running shoes"}
+    enhance_body = {"refined": ANSWER["after"], "audience": "runners"}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as http:
+            for name, path, body, measure in [
+                ("/refine", "/refine", refine_body, measure_blocking),
+                ("/refine/stream", "/refine/stream", refine_body, measure_stream),
+                ("/enhance", "/enhance", enhance_body, measure_blocking),
+                ("/enhance/stream", "/enhance/stream", enhance_body, measure_stream),
+            ]:
+                samples = [await measure(http, path, body) for _ in range(args.requests)]
+                summarize(name, samples)
+    finally:
+        server.should_exit = True
+        await serving
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--first-token", type=float, default=0.3, help="upstream delay before the first chunk (s)")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="upstream delay between chunks (s)")
+    asyncio.run(main_async(parser.parse_args()))
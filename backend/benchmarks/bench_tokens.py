@@ -0,0 +1,115 @@
+"""
+Speed and accuracy of the local token estimator, and what compaction saves.
+
+Estimates for the prompts in fixtures/language_samples.jsonl and the
+shipped system prompts are compared with the chars/4 rule of thumb and,
+when the optional `tiktoken` package is installed, with the real o200k
+tokenizer. Compaction is measured on the same prompts as pasted by users:
+with stray spaces, trailing whitespace, runs of blank lines and lines
+pasted twice (--noise controls how much).
+
+Usage (from backend/):
+    python benchmarks/bench_tokens.py [--repeat 200] [--noise 0.3] [--seed 1]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tokens  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "language_samples.jsonl")
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def load_texts() -> list[str]:
+    with open(FIXTURES, encoding="utf-8") as f:
+        samples = [json.loads(line)["text"] for line in f if line.strip()]
+    # Longer multi-paragraph prompts built from the samples, like pasted briefs.
+    briefs = ["\n\n".join(samples[i:i + 8]) for i in range(0, len(samples), 8)]
+    return samples + briefs
+
+
+def system_prompts() -> list[str]:
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    import main
+
+    return [part for t in (main.REFINE_PROMPT, main.ENHANCE_PROMPT, main.CONTEXT_REFLECTION_PROMPT)
+            for part in t.system]
+
+
+def add_noise(text: str, rng: random.Random, noise: float) -> str:
+    lines = []
+    for line in text.split("\n"):
+        words = line.split(" ")
+        line = " ".join(w + " " * (rng.random() < noise) * rng.randint(1, 3) for w in words)
+        lines.append(line + " " * rng.randint(0, 4))
+        if rng.random() < noise / 3:
+            lines.append(lines[-1])
+        if rng.random() < noise:
+            lines.extend([""] * rng.randint(1, 3))
+    return "\n".join(lines)
+
+
+def timed_us(function, texts: list[str], repeat: int) -> list[float]:
+    timings = []
+    for text in texts:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            function(text)
+        timings.append((time.perf_counter() - started) / repeat * 1e6)
+    return timings
+
+
+def error_report(name: str, estimates: list[int], reference: list[int]):
+    errors = [abs(e - r) / r for e, r in zip(estimates, reference) if r]
+    print(f"  {name:<10} mean abs error {statistics.mean(errors):.1%}  "
+          f"max {max(errors):.1%}  total {sum(estimates)} vs {sum(reference)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="timing repetitions per text")
+    parser.add_argument("--noise", type=float, default=0.3, help="probability of each kind of paste noise")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    texts = load_texts() + system_prompts()
+    chars = sum(len(t) for t in texts)
+    timings = timed_us(tokens.estimate, texts, args.repeat)
+    print(f"estimate: {len(texts)} texts, {chars:,} chars, "
+          f"p50={statistics.median(timings):.1f}us, {sum(timings) / chars * 1000:.1f}us per 1000 chars")
+
+    if tiktoken is not None:
+        encoding = tiktoken.get_encoding("o200k_base")
+        reference = [len(encoding.encode(t)) for t in texts]
+        print("accuracy against tiktoken o200k_base:")
+        error_report("estimate", [tokens.estimate(t) for t in texts], reference)
+        error_report("chars/4", [len(t) // 4 for t in texts], reference)
+    else:
+        print("accuracy: install tiktoken to compare against the real tokenizer")
+
+    rng = random.Random(args.seed)
+    noisy = [add_noise(t, rng, args.noise) for t in load_texts()]
+    compacted = [tokens.compact(t) for t in noisy]
+    before = sum(tokens.estimate(t) for t in noisy)
+    after = sum(tokens.estimate(t) for t in compacted)
+    timings = timed_us(tokens.compact, noisy, args.repeat)
+    print(f"compact: {len(noisy)} noisy prompts, {before} -> {after} estimated tokens "
+          f"({1 - after / before:.1%} saved), {sum(len(t) for t in noisy):,} -> "
+          f"{sum(len(t) for t in compacted):,} chars, p50={statistics.median(timings):.1f}us")
+
+    notes = [" ".join(rng.choice(noisy[:20]).split()[:12]) + "." for _ in range(40)]
+    notes_text = "\n".join(notes + notes[:10])
+    trimmed = tokens.trim_notes(notes_text, 300)
+    print(f"trim_notes: {tokens.estimate(notes_text)} -> {tokens.estimate(trimmed)} estimated tokens "
+          f"(budget 300)")
@@ -0,0 +1,160 @@
+"""
+Throughput of the API served by 1 to N worker processes.
+
+Starts the local stand-ins, fake_redis.py as the shared storage and
+fake_openai.py (with --upstream-workers processes of its own so it is not
+the bottleneck), then for each worker count serves the API with
+`python main.py` and WEB_CONCURRENCY, waits until /health/ready answers,
+and drives one scenario from --clients load-generator processes. Response
+caching, near-duplicate reuse, coalescing and hedging are off, so every
+request does its full work. Reports throughput, p50/p99 latency, speedup
+over one worker and scaling efficiency (speedup / workers).
+
+Scaling is bounded by CPU cores: the stand-ins and load generators need
+cores too, so expect near-linear gains up to about the cores left for the
+API, and a flat line beyond that (or on a single-core machine).
+
+Usage (from backend/):
+    python benchmarks/bench_workers.py [--workers 1 2 4] [--scenario enhance] \\
+        [--requests 2000] [--concurrency 64] [--clients 2] [--output scaling.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, BENCHMARKS)
+
+from loadtest import SCENARIOS, run_level  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(command: list[str], env: dict | None = None) -> subprocess.Popen:
+    return subprocess.Popen(command, cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop(process: subprocess.Popen):
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def wait_ready(url: str, successes: int, timeout: float = 60.0):
+    """Wait for `successes` consecutive 200s, so (very likely) every worker is ready."""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while streak < successes:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{url} not ready after {timeout}s")
+        try:
+            streak = streak + 1 if httpx.get(url, timeout=2).status_code == 200 else 0
+        except httpx.HTTPError:
+            streak = 0
+        if streak == 0:
+            time.sleep(0.2)
+
+
+def drive(url: str, scenario: str, concurrency: int, total: int) -> dict:
+    """One load-generator process."""
+    async def run():
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=None, limits=limits) as http:
+            return await run_level(http, scenario, concurrency, total, unique=True)
+    return asyncio.run(run())
+
+
+def measure(url: str, args) -> dict:
+    per_client = max(1, args.concurrency // args.clients)
+    with ProcessPoolExecutor(args.clients) as pool:
+        # Warm connections and code paths before measuring.
+        list(pool.map(drive, [url] * args.clients, [args.scenario] * args.clients,
+                      [per_client] * args.clients, [per_client * 2] * args.clients))
+        rows = list(pool.map(drive, [url] * args.clients, [args.scenario] * args.clients,
+                             [per_client] * args.clients, [args.requests // args.clients] * args.clients))
+    return {
+        "throughput_rps": round(sum(r["throughput_rps"] for r in rows), 2),
+        "errors": sum(r["errors"] + r["shed"] for r in rows),
+        "p50_ms": round(max(r["latency_ms"]["p50"] for r in rows), 2),
+        "p99_ms": round(max(r["latency_ms"]["p99"] for r in rows), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="API worker counts to compare")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="enhance")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=64, help="in-flight requests across all clients")
+    parser.add_argument("--clients", type=int, default=2, help="load-generator processes")
+    parser.add_argument("--latency", default="fixed:0.02", help="fake upstream latency spec")
+    parser.add_argument("--upstream-workers", type=int, default=2, help="fake_openai.py processes")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    redis_port, upstream_port = free_port(), free_port()
+    stand_ins = [
+        start([sys.executable, "benchmarks/fake_redis.py", "--port", str(redis_port)]),
+        start([sys.executable, "benchmarks/fake_openai.py", "--port", str(upstream_port),
+               "--latency", args.latency, "--first-token", "0", "--chunk-delay", "0",
+               "--workers", str(args.upstream_workers)]),
+    ]
+    results = []
+    try:
+        wait_ready(f"http://127.0.0.1:{upstream_port}/stats", 1)
+        for workers in args.workers:
+            port = free_port()
+            env = {
+                **os.environ,
+                "WEB_CONCURRENCY": str(workers),
+                "PORT": str(port),
+                "STORAGE_BACKEND": "redis",
+                "REDIS_URL": f"redis://127.0.0.1:{redis_port}/0",
+                "OPENAI_API_KEY": "sk-bench",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{upstream_port}/v1",
+                "CACHE_REFINE": "false",
+                "CACHE_ENHANCE": "false",
+                "NEAR_DUPLICATE_ENABLED": "false",
+                "COALESCE_ENABLED": "false",
+                "HEDGE_ENABLED": "false",
+            }
+            env.pop("METRICS_DIR", None)
+            api = start([sys.executable, "main.py"], env)
+            try:
+                url = f"http://127.0.0.1:{port}"
+                wait_ready(f"{url}/health/ready", 3 * workers)
+                row = {"workers": workers, **measure(url, args)}
+            finally:
+                stop(api)
+            base = results[0]["throughput_rps"] if results else row["throughput_rps"]
+            base_workers = results[0]["workers"] if results else workers
+            row["speedup"] = round(row["throughput_rps"] / base, 2) if base else 0.0
+            row["efficiency"] = round(row["speedup"] / (workers / base_workers), 2)
+            results.append(row)
+            print(f"workers={workers:<3} {row['throughput_rps']:>8.1f} req/s  p50={row['p50_ms']:>7.1f}ms  "
+                  f"p99={row['p99_ms']:>7.1f}ms  errors={row['errors']:<4} speedup={row['speedup']:.2f}x  "
+                  f"efficiency={row['efficiency']:.0%}", flush=True)
+    finally:
+        for process in stand_ins:
+            stop(process)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": os.cpu_count(), "args": vars(args), "results": results}, f, indent=2)
@@ -0,0 +1,235 @@
+"""
+Fake OpenAI-compatible chat-completions server for benchmarks.
+
+Answers POST /v1/chat/completions (plain and streamed) with canned JSON for
+each call site (refine, enhance, context questions, language detection),
+after a latency drawn from a configurable distribution. Usage is reported
+as chars/4 estimates, with the first system message counted as cached once
+it has been seen before, like provider prefix caching. GET /stats returns
+call counts per kind and POST /reset clears them. With --max-concurrency,
+calls beyond that many in flight get an immediate HTTP 429, like a
+provider rate limit, to exercise load shedding.
+
+Run standalone and point the API at it:
+    python benchmarks/fake_openai.py --port 8001 --latency lognormal:0.5:0.4
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=sk-fake uvicorn main:app
+
+or build it in-process with `create_app(...)` and mount it behind an
+httpx.ASGITransport (see loadtest.py).
+
+With --workers the server runs several processes (call counts and
+--max-concurrency are then per process), so it keeps up with a
+multi-worker API; see bench_workers.py.
+
+Latency specs: "fixed:0.5", "uniform:0.2:0.8", "normal:0.5:0.1",
+"lognormal:<median>:<sigma>" (seconds, never below zero). --model-latency
+gives individual models their own spec, e.g. a faster fallback model:
+    --model-latency gpt-4o-mini=fixed:0.2
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED = {
+    "refine": {
+        "before": "write a marketing email",
+        "after": ("Role & Perspective:\n\nAct as a senior marketing strategist.\n\n"
+                  "Objective:\n\nDraft a launch email that converts existing customers.\n\n"
+                  "Output Requirements:\n\n- Subject line, preview text and body under 200 words."),
+        "why": "Added role, objective, deliverables and constraints.",
+        "language": "en",
+    },
+    "enhance": {
+        "before": "Act as a senior marketing strategist.",
+        "after": ("Context:\n\nYou are writing for returning customers aged 25-40.\n\n"
+                  "Objective:\n\nDrive pre-orders within the first week."),
+        "why": "Aligned the prompt with the audience, outcome and constraints.",
+    },
+    "questions": {"questions": ["Who is this for?", "What should it achieve?", "Any tone or length limits?"]},
+    "detect_language": "en",
+}
+KIND_MARKERS = [
+    ("detect_language", "Detect the language"),
+    ("questions", "Context Mirror"),
+    ("enhance", "elevate it further"),
+]
+
+
+def parse_latency(spec: str):
+    """Return a zero-argument sampler for a latency spec such as "lognormal:0.5:0.4"."""
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+
+def classify(messages: list[dict]) -> str:
+    system = messages[0]["content"] if messages else ""
+    for kind, marker in KIND_MARKERS:
+        if marker in system:
+            return kind
+    return "refine"
+
+
+def create_app(latency: str = "fixed:0.5", first_token: float = 0.2, chunk_delay: float = 0.01,
+               chunk_size: int = 16, canned: dict | None = None, error_rate: float = 0.0,
+               seed: int | None = None, max_concurrency: int = 0,
+               model_latency: dict[str, str] | None = None) -> FastAPI:
+    """Build the fake server. `latency` is the total time for non-streamed answers."""
+    if seed is not None:
+        random.seed(seed)
+    default_latency = parse_latency(latency)
+    model_samplers = {model: parse_latency(spec) for model, spec in (model_latency or {}).items()}
+    answers = {**CANNED, **(canned or {})}
+    calls = Counter()
+    seen_prefixes = set()
+    active = 0
+    app = FastAPI()
+
+    def usage(messages: list[dict], content: str) -> dict:
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        prefix = messages[0]["content"] if messages else ""
+        cached = 0
+        if prefix in seen_prefixes and len(prefix) // 4 >= 1024:
+            cached = (len(prefix) // 4) // 128 * 128
+        seen_prefixes.add(prefix)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": "bench"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        nonlocal active
+        payload = await request.json()
+        messages = payload.get("messages", [])
+        kind = classify(messages)
+        calls[kind] += 1
+        answer = answers[kind]
+        content = answer if isinstance(answer, str) else json.dumps(answer)
+        created = int(time.time())
+        model = payload.get("model", "fake-model")
+        sample_latency = model_samplers.get(model, default_latency)
+
+        if max_concurrency and active >= max_concurrency:
+            calls["rate_limited"] += 1
+            return JSONResponse(status_code=429, content={"error": {"message": "fake rate limit"}})
+
+        if error_rate and random.random() < error_rate:
+            calls["errors"] += 1
+            await asyncio.sleep(sample_latency())
+            return JSONResponse(status_code=500, content={"error": {"message": "fake upstream error"}})
+
+        if not payload.get("stream"):
+            active += 1
+            try:
+                await asyncio.sleep(sample_latency())
+            finally:
+                active -= 1
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage(messages, content),
+            }
+
+        include_usage = (payload.get("stream_options") or {}).get("include_usage")
+
+        async def chunks():
+            nonlocal active
+            active += 1
+            try:
+                await asyncio.sleep(first_token)
+                for i in range(0, len(content), chunk_size):
+                    chunk = {
+                        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "finish_reason": None,
+                                     "delta": {"content": content[i:i + chunk_size]}}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(chunk_delay)
+                if include_usage:
+                    chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                             "model": model, "choices": [], "usage": usage(messages, content)}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                active -= 1
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        failures = ("errors", "rate_limited")
+        return {"calls": dict(calls), "total": sum(v for k, v in calls.items() if k not in failures)}
+
+    @app.post("/reset")
+    async def reset():
+        calls.clear()
+        seen_prefixes.clear()
+        return {"ok": True}
+
+    app.state.calls = calls
+    return app
+
+
+def app_from_env() -> FastAPI:
+    """uvicorn factory for --workers: create_app() with the options in FAKE_OPENAI_OPTIONS."""
+    return create_app(**json.loads(os.environ.get("FAKE_OPENAI_OPTIONS", "{}")))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="fixed:0.5", help="latency spec for non-streamed answers")
+    parser.add_argument("--first-token", type=float, default=0.2, help="delay before the first streamed chunk (s)")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="delay between streamed chunks (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 500")
+    parser.add_argument("--max-concurrency", type=int, default=0,
+                        help="answer calls beyond this many in flight with HTTP 429 (0 = unlimited)")
+    parser.add_argument("--model-latency", nargs="*", default=[], metavar="MODEL=SPEC",
+                        help="per-model latency specs overriding --latency")
+    parser.add_argument("--responses", help="JSON file overriding the canned answers per kind")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int, default=1, help="server processes")
+    args = parser.parse_args()
+
+    canned = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            canned = json.load(f)
+    options = dict(latency=args.latency, first_token=args.first_token, chunk_delay=args.chunk_delay,
+                   canned=canned, error_rate=args.error_rate, seed=args.seed,
+                   max_concurrency=args.max_concurrency,
+                   model_latency=dict(item.split("=", 1) for item in args.model_latency))
+    if args.workers > 1:
+        os.environ["FAKE_OPENAI_OPTIONS"] = json.dumps(options)
+        uvicorn.run("fake_openai:app_from_env", factory=True, workers=args.workers,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)),
+                    host=args.host, port=args.port, log_level="warning")
+    else:
+        uvicorn.run(create_app(**options), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,227 @@
+"""
+Minimal in-memory Redis server for benchmarks.
+
+Speaks RESP2 (and enough RESP3 for clients that ask for it with HELLO 3)
+over TCP and implements the commands storage.RedisStorage
+uses (PING, GET, MGET, SET with PX/EX/NX, MSET, DEL, INCRBY, SCAN with
+MATCH/COUNT, MULTI/EXEC/DISCARD, and EVAL of the compare-and-delete
+script only) plus the connection handshake redis-py sends. State is one dict in this process, so several API workers pointed at
+it share storage the way they would share a real Redis, without installing
+one.
+
+Run standalone and point the API at it:
+    python benchmarks/fake_redis.py --port 6390
+    STORAGE_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 python main.py
+"""
+import argparse
+import asyncio
+import fnmatch
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import DELETE_IF_EQUAL_SCRIPT  # noqa: E402
+
+
+class SimpleString(str):
+    pass
+
+
+class Error(str):
+    pass
+
+
+OK = SimpleString("OK")
+
+
+def encode(value, resp3: bool = False) -> bytes:
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, Error):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, SimpleString):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(encode(v, resp3) for v in value)
+    data = value.encode() if isinstance(value, str) else value
+    return b"$" + str(len(data)).encode() + b"\r\n" + data + b"\r\n"
+
+
+class Store:
+    def __init__(self):
+        self.data: dict[str, bytes] = {}
+        self.expires: dict[str, float] = {}
+        self.commands = 0
+
+    def _live(self, key: str) -> bytes | None:
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def execute(self, args: list[bytes]):
+        self.commands += 1
+        name = args[0].decode().upper()
+        rest = [a.decode() for a in args[1:]] if name not in ("SET", "MSET") else args[1:]
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            return Error(f"ERR unknown command '{name}'")
+        try:
+            return handler(*rest)
+        except (TypeError, ValueError, IndexError) as e:
+            return Error(f"ERR {name}: {e}")
+
+    def cmd_ping(self, *message):
+        return message[0] if message else SimpleString("PONG")
+
+    def cmd_hello(self, *args):
+        # A flat array rather than a RESP3 map; clients only check it is not an error.
+        return ["server", "redis", "version", "7.2.0", "proto", int(args[0]) if args else 2, "id", 1,
+                "mode", "standalone", "role", "master", "modules", []]
+
+    def cmd_client(self, *args):
+        return OK
+
+    def cmd_select(self, db):
+        return OK
+
+    def cmd_get(self, key):
+        return self._live(key)
+
+    def cmd_mget(self, *keys):
+        return [self._live(k) for k in keys]
+
+    def cmd_set(self, key, value, *options):
+        key = key.decode()
+        options = [o.decode().upper() for o in options]
+        ttl = None
+        if "PX" in options:
+            ttl = int(options[options.index("PX") + 1]) / 1000
+        elif "EX" in options:
+            ttl = int(options[options.index("EX") + 1])
+        if "NX" in options and self._live(key) is not None:
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if ttl:
+            self.expires[key] = time.monotonic() + ttl
+        return OK
+
+    def cmd_mset(self, *pairs):
+        for key, value in zip(pairs[::2], pairs[1::2]):
+            self.data[key.decode()] = value
+            self.expires.pop(key.decode(), None)
+        return OK
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            removed += self._live(key) is not None
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_eval(self, script, numkeys, *keys_and_args):
+        # No Lua here: the one script storage.RedisStorage sends, compare-and-delete.
+        if script != DELETE_IF_EQUAL_SCRIPT:
+            return Error("ERR only the compare-and-delete script is supported")
+        key, value = keys_and_args
+        if self._live(key) != value.encode():
+            return 0
+        return self.cmd_del(key)
+
+    def cmd_incrby(self, key, amount):
+        value = int(self._live(key) or 0) + int(amount)
+        self.data[key] = str(value).encode()
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def cmd_scan(self, cursor, *options):
+        options = list(options)
+        upper = [o.upper() for o in options]
+        match = options[upper.index("MATCH") + 1] if "MATCH" in upper else "*"
+        count = int(options[upper.index("COUNT") + 1]) if "COUNT" in upper else 10
+        keys = sorted(k for k in list(self.data) if self._live(k) is not None)
+        start = int(cursor)
+        batch = keys[start:start + count]
+        following = start + count if start + count < len(keys) else 0
+        return [str(following), [k for k in batch if fnmatch.fnmatchcase(k, match)]]
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()  # inline command, e.g. from redis-cli or telnet
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+def create_handler(store: Store):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        queued: list | None = None
+        resp3 = False
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                name = args[0].upper()
+                if name == b"MULTI":
+                    queued, reply = [], OK
+                elif name == b"EXEC":
+                    reply = [store.execute(a) for a in queued or []]
+                    queued = None
+                elif name == b"DISCARD":
+                    queued, reply = None, OK
+                elif queued is not None:
+                    queued.append(args)
+                    reply = SimpleString("QUEUED")
+                else:
+                    reply = store.execute(args)
+                    if name == b"HELLO" and not isinstance(reply, Error):
+                        resp3 = args[1:2] == [b"3"]
+                writer.write(encode(reply, resp3))
+                # Pipelined commands are answered in one write.
+                if not reader._buffer:
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 6390) -> tuple[asyncio.AbstractServer, Store]:
+    store = Store()
+    server = await asyncio.start_server(create_handler(store), host, port)
+    return server, store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    async def main():
+        server, _ = await start_server(args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
@@ -0,0 +1,332 @@
+"""
+Load-test harness for /refine, /enhance, /feedback and /feedback/global-avg.
+
+By default everything runs in one process: the API is driven through an
+ASGI transport, its OpenAI client talks to fake_openai.py over another
+ASGI transport, and storage is the in-memory backend. Response caching,
+near-duplicate reuse and coalescing are off unless --cache is given, so
+every request reaches the fake upstream. Pass --url to load a running server
+instead (add --upstream-url when it points at a standalone fake_openai.py,
+to collect upstream call counts).
+
+For each scenario and concurrency level the harness reports p50/p95/p99
+latency, throughput, errors and upstream calls per kind. --output writes
+the results as JSON; --baseline compares them against an earlier file and
+prints the change per metric.
+
+To measure behaviour under overload, cap the fake upstream with
+--upstream-capacity (calls beyond it get HTTP 429) and drive it past that.
+Shed requests (HTTP 503) are counted apart from other errors, and goodput
+is the rate of successful responses within --slo seconds. Compare against
+--no-limiter to see what the adaptive limiter and breaker buy.
+
+Tail latency with hedging: use a heavy-tailed --latency (e.g.
+lognormal:0.3:0.8), optionally a faster --model-latency for HEDGE_MODEL,
+and compare against --no-hedge.
+
+In-process runs also count storage operations per kind, e.g. to compare
+the feedback scenario with and without --write-behind.
+
+Usage (from backend/):
+    python benchmarks/loadtest.py --levels 1 10 50 --requests 200 --latency lognormal:0.3:0.3 \\
+        --output results.json [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+sys.path.insert(0, BENCHMARKS)
+
+SCENARIOS = ["refine", "enhance", "feedback", "feedback-global-avg"]
+PROMPTS = [
+    "write a marketing email for our new running shoes",
+    "explain how python decorators work with examples",
+    "create a go-to-market strategy for a B2B analytics startup",
+    "design a logo brief for a craft brewery",
+    "build a lesson plan on photosynthesis for twelve year olds",
+]
+
+
+def build_request(scenario: str, i: int, unique: bool) -> tuple[str, str, dict | None]:
+    """(method, path, JSON body) for the i-th request of a scenario."""
+    suffix = f" (variant {i})" if unique else ""
+    prompt = PROMPTS[i % len(PROMPTS)] + suffix
+    if scenario == "refine":
+        return "POST", "/refine", {"text": prompt}
+    if scenario == "enhance":
+        return "POST", "/enhance", {
+            "refined": f"Act as a senior strategist. {prompt}",
+            "audience": "busy professionals",
+            "outcome": "a clear next step",
+            "language": "en",
+        }
+    if scenario == "feedback":
+        return "POST", "/feedback", {"prompt_id": f"loadtest-{i % 100}", "rating": 1 + i % 5}
+    if scenario == "feedback-global-avg":
+        return "GET", "/feedback/global-avg", None
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+async def run_level(http: httpx.AsyncClient, scenario: str, concurrency: int, total: int, unique: bool,
+                    slo: float | None = None) -> dict:
+    latencies, shed_latencies, errors = [], [], 0
+    next_index = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in next_index:
+            method, path, body = build_request(scenario, i, unique)
+            sent = time.perf_counter()
+            try:
+                r = await http.request(method, path, json=body)
+                status = r.status_code
+            except httpx.HTTPError:
+                status = None
+            if status is not None and status < 400:
+                latencies.append(time.perf_counter() - sent)
+            elif status == 503:
+                shed_latencies.append(time.perf_counter() - sent)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    good = sum(1 for latency in latencies if slo is None or latency <= slo)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "shed": len(shed_latencies),
+        "shed_latency_ms": round(sum(shed_latencies) / len(shed_latencies) * 1000, 2) if shed_latencies else None,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "goodput_rps": round(good / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+    }
+
+
+class InProcessTarget:
+    """The API and the fake upstream wired together through ASGI transports."""
+
+    def __init__(self, args):
+        os.environ.setdefault("OPENAI_API_KEY", "sk-loadtest")
+        os.environ["STORAGE_BACKEND"] = "memory"
+        if not args.cache:
+            for flag in ("CACHE_REFINE", "CACHE_ENHANCE", "NEAR_DUPLICATE_ENABLED", "COALESCE_ENABLED"):
+                os.environ[flag] = "false"
+        if args.no_limiter:
+            os.environ["UPSTREAM_LIMIT_ENABLED"] = "false"
+        if args.no_hedge:
+            os.environ["HEDGE_ENABLED"] = "false"
+        if args.write_behind:
+            os.environ["FEEDBACK_WRITE_BEHIND"] = "true"
+
+        import logging
+        import main
+        from fake_openai import create_app
+        from openai import AsyncOpenAI
+
+        logging.disable(logging.INFO)
+        self.main = main
+        self.upstream = create_app(args.latency, args.first_token, args.chunk_delay,
+                                   error_rate=args.error_rate, seed=args.seed,
+                                   max_concurrency=args.upstream_capacity,
+                                   model_latency=dict(item.split("=", 1) for item in args.model_latency))
+        main.client = AsyncOpenAI(
+            api_key="sk-loadtest",
+            base_url="http://upstream/v1",
+            max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=self.upstream), timeout=None),
+        )
+        self.http = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://api", timeout=None)
+        self._storage_seen: dict[str, int] = {}
+
+    async def start(self):
+        # The ASGI transport sends no lifespan events; start what startup would.
+        if self.main.FEEDBACK_WRITE_BEHIND:
+            self.main.feedback_buffer.start()
+
+    def storage_ops(self) -> dict:
+        """Storage operations per kind since the last call."""
+        counts = {}
+        for (stage,), state in self.main.metrics.stage_seconds._values.items():
+            if stage.startswith("storage_"):
+                kind = stage[len("storage_"):]
+                counts[kind] = state["count"] - self._storage_seen.get(kind, 0)
+                self._storage_seen[kind] = state["count"]
+        return {k: v for k, v in counts.items() if v}
+
+    async def upstream_calls(self) -> dict:
+        # Deferred context questions finish after /refine returns; count them too.
+        if self.main.question_jobs:
+            await asyncio.gather(*list(self.main.question_jobs.values()), return_exceptions=True)
+        calls = dict(self.upstream.state.calls)
+        self.upstream.state.calls.clear()
+        return calls
+
+    async def close(self):
+        await self.main.feedback_buffer.close()
+        await self.http.aclose()
+        await self.main.client.close()
+
+
+class RemoteTarget:
+    """A running API, optionally backed by a standalone fake_openai.py."""
+
+    def __init__(self, args):
+        self.http = httpx.AsyncClient(base_url=args.url, timeout=None,
+                                      limits=httpx.Limits(max_connections=max(args.levels)))
+        self.upstream = httpx.AsyncClient(base_url=args.upstream_url, timeout=10) if args.upstream_url else None
+
+    async def start(self):
+        pass
+
+    def storage_ops(self) -> None:
+        return None
+
+    async def upstream_calls(self) -> dict | None:
+        if self.upstream is None:
+            return None
+        calls = (await self.upstream.get("/stats")).json()["calls"]
+        await self.upstream.post("/reset")
+        return calls
+
+    async def close(self):
+        await self.http.aclose()
+        if self.upstream is not None:
+            await self.upstream.aclose()
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BENCHMARKS, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_row(row: dict):
+    latency = row["latency_ms"]
+    calls = row.get("upstream_calls")
+    if calls is None:
+        calls_text = "n/a"
+    else:
+        calls_text = " ".join(f"{k}={v}" for k, v in sorted(calls.items())) or "0"
+    ops = row.get("storage_ops")
+    ops_text = "" if ops is None else "  storage: " + (" ".join(f"{k}={v}" for k, v in sorted(ops.items())) or "0")
+    print(f"{row['scenario']:<20} c={row['concurrency']:<4} {row['throughput_rps']:>8.1f} req/s  "
+          f"p50={latency['p50']:>8.1f}ms p95={latency['p95']:>8.1f}ms p99={latency['p99']:>8.1f}ms  "
+          f"goodput={row['goodput_rps']:>7.1f}/s shed={row['shed']:<4} errors={row['errors']:<3} "
+          f"upstream: {calls_text}{ops_text}")
+
+
+def compare(results: list[dict], baseline_path: str):
+    """Print the relative change of throughput and latency percentiles against a baseline file."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nvs. baseline {baseline_path} (commit {baseline.get('commit')}):")
+    for row in results:
+        old = previous.get((row["scenario"], row["concurrency"]))
+        if old is None:
+            continue
+        deltas = []
+        for label, new_value, old_value in [
+            ("throughput", row["throughput_rps"], old["throughput_rps"]),
+            ("goodput", row.get("goodput_rps", 0.0), old.get("goodput_rps", 0.0)),
+            *((k, row["latency_ms"][k], old["latency_ms"][k]) for k in ("p50", "p95", "p99")),
+        ]:
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            deltas.append(f"{label} {change:+.1f}%")
+        print(f"{row['scenario']:<20} c={row['concurrency']:<4} " + "  ".join(deltas))
+
+
+async def main_async(args) -> dict:
+    target = RemoteTarget(args) if args.url else InProcessTarget(args)
+    results = []
+    try:
+        await target.start()
+        await target.upstream_calls()
+        target.storage_ops()
+        for scenario in args.scenarios:
+            for level in args.levels:
+                row = await run_level(target.http, scenario, level, args.requests,
+                                      unique=not args.repeat_inputs, slo=args.slo)
+                row["upstream_calls"] = await target.upstream_calls()
+                row["storage_ops"] = target.storage_ops()
+                print_row(row)
+                results.append(row)
+    finally:
+        await target.close()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and level")
+    parser.add_argument("--latency", default="lognormal:0.3:0.3", help="fake upstream latency spec")
+    parser.add_argument("--first-token", type=float, default=0.1)
+    parser.add_argument("--chunk-delay", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--upstream-capacity", type=int, default=0,
+                        help="fake upstream answers calls beyond this many in flight with 429 (0 = unlimited)")
+    parser.add_argument("--slo", type=float, help="latency target (s) a success must meet to count as goodput")
+    parser.add_argument("--no-limiter", action="store_true", help="disable adaptive upstream limiting and the breaker")
+    parser.add_argument("--model-latency", nargs="*", default=[], metavar="MODEL=SPEC",
+                        help="fake upstream latency per model (e.g. for HEDGE_MODEL)")
+    parser.add_argument("--no-hedge", action="store_true", help="disable hedged requests")
+    parser.add_argument("--write-behind", action="store_true", help="buffer feedback writes (FEEDBACK_WRITE_BEHIND)")
+    parser.add_argument("--cache", action="store_true", help="keep response caching, near-duplicates and coalescing on")
+    parser.add_argument("--repeat-inputs", action="store_true", help="cycle a few identical prompts instead of unique ones")
+    parser.add_argument("--url", help="load a running API instead of the in-process app")
+    parser.add_argument("--upstream-url", help="standalone fake_openai.py to read upstream call counts from")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(main_async(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.baseline:
+        compare(report["results"], args.baseline)
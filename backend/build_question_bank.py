@@ -0,0 +1,91 @@
+"""
+Build question_bank.json from logged context questions.
+
+With QUESTIONS_LOG_FILE set, the API appends every set of context questions
+the model generates as a JSON line: {"category", "language", "questions"}.
+This script counts identical sets per category and language and keeps the
+most frequent ones. Records whose language is a description rather than an
+ISO code (inline language detection) are assigned one by detecting the
+language of the questions themselves.
+
+Usage (from backend/):
+    python build_question_bank.py questions.jsonl [more.jsonl ...] \\
+        --output question_bank.json [--merge question_bank.json] [--sets 3] [--min-count 2]
+"""
+import argparse
+import json
+import re
+from collections import Counter
+
+from language import detect
+from question_bank import QUESTION_COUNT, dump
+
+LANGUAGE_CODE_RE = re.compile(r"^[a-z]{2,3}$")
+SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    return SPACE_RE.sub(" ", str(question)).strip()
+
+
+def read_records(paths: list[str]):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"{path}:{number}: skipping invalid JSON")
+
+
+def count_sets(records) -> dict[tuple[str, str], Counter]:
+    """Occurrences of each distinct question set per (category, language)."""
+    counts: dict[tuple[str, str], Counter] = {}
+    for record in records:
+        questions = tuple(normalize_question(q) for q in record.get("questions") or [])
+        if len(questions) != QUESTION_COUNT or len(set(questions)) != QUESTION_COUNT or not all(questions):
+            continue
+        language = str(record.get("language") or "").strip().lower()
+        if not LANGUAGE_CODE_RE.match(language):
+            language, _ = detect(" ".join(questions))
+        category = record.get("category") or "general"
+        counts.setdefault((category, language), Counter())[questions] += 1
+    return counts
+
+
+def build(counts: dict[tuple[str, str], Counter], sets_per_cell: int, min_count: int,
+          base: dict | None = None) -> dict:
+    """Most frequent sets per cell, on top of `base`; cells without enough data keep the base sets."""
+    questions = {category: dict(languages) for category, languages in (base or {}).items()}
+    for (category, language), counter in sorted(counts.items()):
+        frequent = [list(s) for s, n in counter.most_common(sets_per_cell) if n >= min_count]
+        if frequent:
+            questions.setdefault(category, {})[language] = frequent
+    return questions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="JSONL files written via QUESTIONS_LOG_FILE")
+    parser.add_argument("--output", default="question_bank.json")
+    parser.add_argument("--merge", help="existing bank whose cells are kept unless the logs replace them")
+    parser.add_argument("--sets", type=int, default=3, help="question sets kept per category and language")
+    parser.add_argument("--min-count", type=int, default=2, help="times a set must have been generated")
+    args = parser.parse_args()
+
+    base = None
+    if args.merge:
+        with open(args.merge, encoding="utf-8") as f:
+            base = json.load(f)["questions"]
+
+    counts = count_sets(read_records(args.logs))
+    questions = build(counts, args.sets, args.min_count, base)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(dump(questions))
+
+    total = sum(sum(c.values()) for c in counts.values())
+    print(f"Read {total} question sets in {len(counts)} cells; "
+          f"wrote {sum(len(v) for v in questions.values())} cells to {args.output}")
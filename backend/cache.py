@@ -0,0 +1,138 @@
+"""
+Two-tier response cache for /refine and /enhance.
+
+Lookups hit a bounded in-process LRU first, then the shared storage backend
+(see storage.py), where entries expire after a TTL. Shared-tier calls are
+capped at `shared_timeout` seconds: a slow read is a miss and a slow write
+is skipped, so a struggling backend cannot stall requests. Keys hash the
+normalized request together with a fingerprint of everything that shapes
+the model output (model name, system prompts, temperatures), so editing a
+prompt or switching models starts from an empty cache without any explicit
+flush.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r"\s+")
+KEY_PREFIX = "cache"
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different inputs share a key."""
+    return WHITESPACE_RE.sub(" ", text).strip().casefold()
+
+
+def fingerprint(*parts) -> str:
+    """Short stable hash of the settings that determine an endpoint's output."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """In-process LRU in front of a shared, TTL-bound storage layer."""
+
+    def __init__(self, storage: Storage, max_entries: int = 1000, ttl: float = 86400.0,
+                 shared_timeout: float | None = None):
+        self.storage = storage
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_timeout = shared_timeout
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.stats = {"hits_memory": 0, "hits_shared": 0, "misses": 0, "stores": 0, "errors": 0, "timeouts": 0}
+
+    def key(self, endpoint: str, settings: str, *fields) -> str:
+        """Cache key for one request to `endpoint` under the given settings fingerprint."""
+        payload = json.dumps(
+            [normalize_text(f) if isinstance(f, str) else f for f in fields],
+            ensure_ascii=False,
+        )
+        request_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"{KEY_PREFIX}:{endpoint}:{settings}:{request_hash}"
+
+    def _remember(self, key: str, value: dict):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> tuple[dict | None, str]:
+        """Return (value, outcome) where outcome is "memory", "shared" or "miss"."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits_memory"] += 1
+                return value, "memory"
+            del self._entries[key]
+
+        try:
+            raw = await asyncio.wait_for(self.storage.get(key), self.shared_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"Shared cache read timed out after {self.shared_timeout}s")
+            raw = None
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Shared cache read failed: {str(e)}")
+            raw = None
+        if raw is not None:
+            value = json.loads(raw)
+            self._remember(key, value)
+            self.stats["hits_shared"] += 1
+            return value, "shared"
+
+        self.stats["misses"] += 1
+        return None, "miss"
+
+    async def set(self, key: str, value: dict):
+        self._remember(key, value)
+        self.stats["stores"] += 1
+        try:
+            await asyncio.wait_for(self.storage.set(key, json.dumps(value, ensure_ascii=False), ttl=self.ttl),
+                                   self.shared_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"Shared cache write timed out after {self.shared_timeout}s")
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Shared cache write failed: {str(e)}")
+
+    async def invalidate(self, endpoint: str | None = None, scan_count: int = 500) -> int:
+        """Drop every entry for `endpoint` (or all endpoints) from both tiers."""
+        prefix = f"{KEY_PREFIX}:{endpoint}:" if endpoint else f"{KEY_PREFIX}:"
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+        removed = 0
+        cursor = 0
+        while True:
+            cursor, keys = await self.storage.scan(cursor, match=f"{prefix}*", count=scan_count)
+            if keys:
+                await self.storage.delete(*keys)
+                removed += len(keys)
+            if cursor == 0:
+                break
+        return removed
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits_memory"] + self.stats["hits_shared"] + self.stats["misses"]
+        hits = self.stats["hits_memory"] + self.stats["hits_shared"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
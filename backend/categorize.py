@@ -0,0 +1,110 @@
+"""
+Keyword categorizer for prompts.
+
+Keyword tables live in a JSON config (categories.json by default, override
+with CATEGORIES_FILE). All keywords of all categories are compiled once into
+a single regex with word-boundary guards, so one scan of the text finds
+every hit regardless of how many categories or keywords there are. Each hit
+adds the keyword's weight to every category that lists it and the highest
+score wins; ties go to the category listed first. A keyword ending in "*"
+matches any word it starts ("debug*" matches "debugging"), and spaces in a
+keyword match any run of whitespace.
+"""
+import json
+import re
+
+# Lookarounds instead of \b so keywords that start or end with punctuation
+# ("c++", ".net") are still guarded.
+WORD_START = r"(?<!\w)"
+WORD_END = r"(?!\w)"
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Trie markers: a keyword ends here, or a prefix keyword ends here.
+END, PREFIX_END = "", "*"
+
+
+def normalize_keyword(keyword: str) -> str:
+    return WHITESPACE_RE.sub(" ", keyword.casefold()).strip()
+
+
+def trie_pattern(node: dict) -> str:
+    """
+    Regex for a character trie. Shared prefixes are factored out, so the
+    engine follows one branch per character instead of trying every keyword
+    at every position.
+    """
+    branches = []
+    for char in sorted(k for k in node if k not in (END, PREFIX_END)):
+        token = r"\s+" if char == " " else re.escape(char)
+        branches.append(token + trie_pattern(node[char]))
+    # Longer continuations first, then the prefix wildcard, then a plain end.
+    if PREFIX_END in node:
+        branches.append(r"\w*")
+    if END in node:
+        branches.append("")
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+class Categorizer:
+    """Scores text against every category in one regex pass."""
+
+    def __init__(self, categories: dict, default: dict):
+        self.default = (default["name"], default["hint"])
+        self.hints = {name: spec["hint"] for name, spec in categories.items()}
+        self.order = {name: i for i, name in enumerate(categories)}
+
+        # keyword -> [(category, weight), ...]; a keyword may serve several categories.
+        self.exact: dict[str, list[tuple[str, float]]] = {}
+        self.prefixes: dict[str, list[tuple[str, float]]] = {}
+        for name, spec in categories.items():
+            weight = float(spec.get("weight", 1.0))
+            for keyword in spec["keywords"]:
+                table = self.prefixes if keyword.endswith("*") else self.exact
+                table.setdefault(normalize_keyword(keyword.rstrip("*")), []).append((name, weight))
+        self.keywords = sorted(self.exact) + sorted(f"{k}*" for k in self.prefixes)
+
+        trie: dict = {}
+        for table, marker in ((self.exact, END), (self.prefixes, PREFIX_END)):
+            for keyword in table:
+                node = trie
+                for char in keyword:
+                    node = node.setdefault(char, {})
+                node[marker] = {}
+        self.regex = re.compile(WORD_START + trie_pattern(trie) + WORD_END) if trie else None
+        self.longest_prefix = max((len(k) for k in self.prefixes), default=0)
+
+    def _targets(self, matched: str) -> list[tuple[str, float]]:
+        """Categories for one matched span: its exact keyword and longest prefix keyword."""
+        key = WHITESPACE_RE.sub(" ", matched)
+        targets = self.exact.get(key, [])
+        for length in range(min(len(key), self.longest_prefix), 0, -1):
+            prefix_targets = self.prefixes.get(key[:length])
+            if prefix_targets is not None:
+                return targets + prefix_targets
+        return targets
+
+    @classmethod
+    def from_file(cls, path: str) -> "Categorizer":
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config["categories"], config["default"])
+
+    def scores(self, text: str) -> dict[str, float]:
+        """Summed keyword weights per category, for categories with at least one hit."""
+        totals: dict[str, float] = {}
+        if self.regex is None:
+            return totals
+        for match in self.regex.finditer(text.casefold()):
+            for name, weight in self._targets(match.group()):
+                totals[name] = totals.get(name, 0.0) + weight
+        return totals
+
+    def categorize(self, text: str) -> tuple[str, str]:
+        """Return (category, context hint) for the best-scoring category."""
+        totals = self.scores(text)
+        if not totals:
+            return self.default
+        best = max(totals, key=lambda name: (totals[name], -self.order[name]))
+        return best, self.hints[best]
@@ -0,0 +1,199 @@
+"""
+Maintenance commands for the Promptodactyl backend.
+
+Usage (from backend/):
+    python cli.py rebuild-ratings [--scan-count 500]
+    python cli.py clear-cache [--endpoint refine|enhance]
+    python cli.py batch prompts.jsonl -o results.jsonl [--concurrency 16] [--url URL]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import main
+
+
+async def _rebuild_ratings(scan_count: int) -> tuple[int, int]:
+    try:
+        return await main.rebuild_rating_totals(scan_count=scan_count)
+    finally:
+        await main.storage.close()
+
+
+def rebuild_ratings(args):
+    total_sum, total_count = asyncio.run(_rebuild_ratings(args.scan_count))
+    avg = round(total_sum / total_count, 1) if total_count > 0 else 0.0
+    print(f"Global ratings rebuilt: sum={total_sum} count={total_count} avg={avg}")
+
+
+async def _clear_cache(endpoint: str | None) -> int:
+    try:
+        return await main.response_cache.invalidate(endpoint)
+    finally:
+        await main.storage.close()
+
+
+def clear_cache(args):
+    removed = asyncio.run(_clear_cache(args.endpoint))
+    print(f"Removed {removed} cached {args.endpoint or 'refine/enhance'} responses")
+
+
+INVALID_LINE = "Invalid JSON line"
+
+
+def read_checkpoint(path: str) -> tuple[set[str], set[int]]:
+    """
+    Ids that already have a successful record in the output file, and the
+    numbers of input lines already reported as invalid JSON.
+    """
+    done, invalid = set(), set()
+    if not os.path.exists(path):
+        return done, invalid
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if record.get("ok"):
+                done.add(str(record["id"]))
+            elif record.get("error") == INVALID_LINE:
+                invalid.add(record["line"])
+    return done, invalid
+
+
+async def pending_lines(args, done: set[str], invalid: set[int], out):
+    """Map input lines to numbered batch lines, skipping ids already refined."""
+    with open(args.input, encoding="utf-8") as f:
+        for number, raw in enumerate(f, 1):
+            if not raw.strip():
+                continue
+            try:
+                item = json.loads(raw)
+                item = {
+                    "id": item.get(args.id_field, number),
+                    "text": item.get(args.text_field, ""),
+                    "language": item.get(args.language_field, "en"),
+                }
+            except (ValueError, AttributeError):
+                if number not in invalid:
+                    out.write(json.dumps({"line": number, "id": number, "ok": False, "error": INVALID_LINE}) + "\n")
+                continue
+            if str(item["id"]) not in done:
+                yield number, json.dumps(item, ensure_ascii=False)
+
+
+async def remote_batch(args, lines):
+    import httpx
+
+    # The server numbers the lines it receives; map them back to input lines.
+    numbers = []
+
+    async def body():
+        async for number, line in lines:
+            numbers.append(number)
+            yield (line + "\n").encode("utf-8")
+
+    async with httpx.AsyncClient(timeout=None) as http:
+        async with http.stream(
+            "POST", f"{args.url.rstrip('/')}/refine/batch",
+            params={"concurrency": args.concurrency},
+            headers={"Content-Type": "application/x-ndjson"},
+            content=body(),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.strip():
+                    record = json.loads(line)
+                    record["line"] = numbers[record["line"] - 1]
+                    yield record
+
+
+async def _batch(args):
+    done, invalid = read_checkpoint(args.output)
+    if done:
+        print(f"Resuming: {len(done)} prompts already refined in {args.output}", file=sys.stderr)
+
+    started = time.perf_counter()
+    succeeded = failed = 0
+    with open(args.output, "a", encoding="utf-8") as out:
+        lines = pending_lines(args, done, invalid, out)
+        if args.url:
+            records = remote_batch(args, lines)
+        else:
+            records = main.refine_batch(lines, args.concurrency)
+        try:
+            async for record in records:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if record["ok"]:
+                    succeeded += 1
+                else:
+                    failed += 1
+                if (succeeded + failed) % 100 == 0:
+                    rate = (succeeded + failed) / (time.perf_counter() - started)
+                    print(f"{succeeded + failed} done ({failed} failed), {rate:.1f}/s", file=sys.stderr)
+        finally:
+            if not args.url:
+                # The OpenAI client is built on first use; a run with nothing to refine never makes one.
+                if main.client is not None:
+                    await main.client.close()
+                await main.storage.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Refined {succeeded} prompts, {failed} failed, in {elapsed:.1f}s -> {args.output}")
+
+
+def batch(args):
+    asyncio.run(_batch(args))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Promptodactyl maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser(
+        "rebuild-ratings",
+        help="backfill the global rating totals from existing rating:* keys",
+        description="Scan every rating:*:sum key (cursor-based SCAN, never KEYS) and overwrite "
+                    "the global sum/count counters. Run once after deploying, or to repair drift. "
+                    "Ratings posted while the scan runs may be missed; rerun if that matters.",
+    )
+    rebuild.add_argument("--scan-count", type=int, default=500, help="SCAN page size hint")
+    rebuild.set_defaults(func=rebuild_ratings)
+
+    clear = commands.add_parser(
+        "clear-cache",
+        help="drop cached /refine and /enhance responses from the shared store",
+        description="Prompt or model changes already invalidate the cache through the key "
+                    "fingerprint; use this to force fresh results without a deploy. "
+                    "Running workers keep their in-process entries until they expire.",
+    )
+    clear.add_argument("--endpoint", choices=["refine", "enhance"], help="limit to one endpoint")
+    clear.set_defaults(func=clear_cache)
+
+    batch_cmd = commands.add_parser(
+        "batch",
+        help="refine a JSONL file of prompts with bounded concurrency",
+        description="Refine every line of a JSONL file and append one record per line to the "
+                    "output in completion order. The output doubles as the checkpoint: rerunning "
+                    "the same command skips ids that already have an ok record and retries the rest.",
+    )
+    batch_cmd.add_argument("input", help="JSONL file of prompts")
+    batch_cmd.add_argument("-o", "--output", required=True, help="JSONL results file (appended to)")
+    batch_cmd.add_argument("--concurrency", type=int, default=main.BATCH_CONCURRENCY)
+    batch_cmd.add_argument("--url", help="send to a running API's /refine/batch instead of refining in-process")
+    batch_cmd.add_argument("--id-field", default="id", help="input field holding the record id (default: line number)")
+    batch_cmd.add_argument("--text-field", default="text", help="input field holding the prompt text")
+    batch_cmd.add_argument("--language-field", default="language")
+    batch_cmd.set_defaults(func=batch)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.func(args)
@@ -0,0 +1,188 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+Within a worker, concurrent callers with the same key share one asyncio
+future: the first becomes the leader and runs the work, the rest await
+its outcome, error included. Across workers the leader also takes a short
+lock in shared storage (SET NX with a TTL); a worker that finds the lock
+taken polls for the result the lock holder publishes instead of starting
+its own upstream call. If the holder disappears without publishing, the
+waiter runs the work itself once the lock expires; a waiter never waits
+past its request deadline (deadline.py). Leaders publish in the
+background, so their own response is not held up by the storage writes,
+and a cancelled leader releases its lock so waiters take over at once.
+A leader's Overloaded or DeadlineExceeded reaches remote waiters as the
+same exception, so they answer 503 or 504 just like the leader; other
+failures become CoalescedError.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+import deadline
+from limiter import Overloaded
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "flight"
+
+
+class CoalescedError(Exception):
+    """The shared computation failed in another worker."""
+
+
+def error_payload(e: Exception) -> dict:
+    """What waiters in other workers need to re-raise `e`."""
+    if isinstance(e, Overloaded):
+        return {"error": str(e), "kind": "overloaded", "reason": e.reason, "retry_after": e.retry_after}
+    if isinstance(e, deadline.DeadlineExceeded):
+        return {"error": str(e), "kind": "deadline", "stage": e.stage}
+    return {"error": str(e) or type(e).__name__}
+
+
+def published_error(payload: dict) -> Exception:
+    kind = payload.get("kind")
+    if kind == "overloaded":
+        return Overloaded(payload["reason"], payload["retry_after"])
+    if kind == "deadline":
+        return deadline.DeadlineExceeded(payload["stage"])
+    return CoalescedError(payload["error"])
+
+
+class SingleFlight:
+    def __init__(self, storage: Storage, lock_ttl: float = 60.0, result_ttl: float = 10.0,
+                 poll_interval: float = 0.05, max_poll_interval: float = 0.5):
+        self.storage = storage
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._publishing: set[asyncio.Task] = set()
+        self.stats = {"leaders": 0, "local_followers": 0, "remote_followers": 0,
+                      "remote_fallbacks": 0, "errors_shared": 0}
+
+    async def do(self, key: str, work) -> tuple[dict, str]:
+        """
+        Run `work()` once per key across all concurrent callers.
+
+        Returns (result, role) where role is "leader", "local" (joined a
+        computation in this worker) or "remote" (result published by
+        another worker).
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["local_followers"] += 1
+            try:
+                return await asyncio.shield(future), "local"
+            except Exception:
+                self.stats["errors_shared"] += 1
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        # Followers retrieve the outcome; this keeps a lone failure from being
+        # reported as "exception was never retrieved".
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result, role = await self._lead(key, work)
+            future.set_result(result)
+            return result, role
+        except asyncio.CancelledError:
+            future.set_exception(CoalescedError("Shared computation was cancelled"))
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _lead(self, key: str, work) -> tuple[dict, str]:
+        lock_key = f"{KEY_PREFIX}:{key}:lock"
+        result_key = f"{KEY_PREFIX}:{key}:result"
+
+        try:
+            acquired = await self.storage.set(lock_key, self.owner, ttl=self.lock_ttl, nx=True)
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable, running locally: {str(e)}")
+            self.stats["leaders"] += 1
+            return await work(), "leader"
+
+        if not acquired:
+            published = await self._await_remote(lock_key, result_key)
+            if published is not None:
+                self.stats["remote_followers"] += 1
+                if "error" in published:
+                    self.stats["errors_shared"] += 1
+                    raise published_error(published)
+                return published["result"], "remote"
+            self.stats["remote_fallbacks"] += 1
+
+        self.stats["leaders"] += 1
+        try:
+            result = await work()
+        except Exception as e:
+            self._in_background(self._publish(result_key, lock_key, error_payload(e)))
+            raise
+        except BaseException:
+            # Cancelled: nothing to publish, but waiters need not sit out the lock TTL.
+            self._in_background(self._release(lock_key))
+            raise
+        self._in_background(self._publish(result_key, lock_key, {"result": result}))
+        return result, "leader"
+
+    def _in_background(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def _await_remote(self, lock_key: str, result_key: str) -> dict | None:
+        """
+        Poll for another worker's result until it appears or its lock lapses.
+        Raises DeadlineExceeded if the request deadline comes first.
+        """
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + self.lock_ttl
+        left = deadline.remaining()
+        request_deadline = left is not None and left < self.lock_ttl
+        if request_deadline:
+            give_up_at = loop.time() + left
+        interval = self.poll_interval
+        while (wait := give_up_at - loop.time()) > 0:
+            await asyncio.sleep(min(interval, wait))
+            interval = min(interval * 2, self.max_poll_interval)
+            try:
+                raw, holder = await self.storage.mget(result_key, lock_key)
+            except Exception as e:
+                logger.warning(f"Single-flight poll failed: {str(e)}")
+                return None
+            if raw is not None:
+                return json.loads(raw)
+            if holder is None:
+                return None
+        if request_deadline:
+            raise deadline.DeadlineExceeded("coalesce")
+        return None
+
+    async def _publish(self, result_key: str, lock_key: str, payload: dict):
+        try:
+            await self.storage.set(result_key, json.dumps(payload, ensure_ascii=False), ttl=self.result_ttl)
+        except Exception as e:
+            logger.warning(f"Single-flight publish failed: {str(e)}")
+        await self._release(lock_key)
+
+    async def _release(self, lock_key: str):
+        # A leader that ran past lock_ttl may find its lock taken over by a
+        # waiter; deleting that would let yet another worker start the work.
+        try:
+            if not await self.storage.delete_if_equal(lock_key, self.owner):
+                logger.info("Single-flight lock expired before release; left to its new holder")
+        except Exception as e:
+            logger.warning(f"Single-flight lock release failed: {str(e)}")
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "in_flight": len(self._inflight), "publishing": len(self._publishing)}
@@ -0,0 +1,53 @@
+"""
+Per-request deadlines shared by every stage of a request.
+
+An endpoint calls `start(REQUEST_DEADLINE)` once. Upstream calls then clamp
+their own timeouts to `remaining()`, so later stages get whatever time the
+earlier ones left instead of a fixed timeout each. The deadline lives in a
+context variable, so tasks spawned while serving the request inherit it.
+"""
+import asyncio
+import contextvars
+import time
+
+# Absolute time.monotonic() deadline of the work being done, or None.
+current: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out during `stage`."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+
+
+def start(seconds: float | None):
+    """Give the current request (or batch line, or task) `seconds` in total; None or 0 removes the limit."""
+    current.set(time.monotonic() + seconds if seconds else None)
+
+
+def remaining() -> float | None:
+    deadline = current.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def clamp(timeout: float | None, stage: str) -> float | None:
+    """`timeout` cut down to the time left; raises DeadlineExceeded if none is."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded(stage)
+    return left if timeout is None else min(timeout, left)
+
+
+async def run(awaitable, stage: str):
+    """Await `awaitable`, cancelling it when the deadline passes."""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(left, 0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage) from None
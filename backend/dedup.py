@@ -0,0 +1,131 @@
+"""
+Near-duplicate index of recent refinements.
+
+Inputs are reduced to character shingles of their normalized text and
+indexed with MinHash + LSH banding, partitioned by (category, language).
+A lookup only returns an entry whose exact shingle Jaccard similarity
+clears the configured threshold, so LSH just narrows the candidates.
+Shingle similarity alone cannot tell "summer sale" from "winter sale" or
+"10 year olds" from "16 year olds", so a match must also have the same
+words and numbers in the same order: only casing, punctuation and
+whitespace may differ. The
+index holds at most `max_entries` refinements and evicts the least
+recently used one first.
+"""
+import random
+import re
+from collections import OrderedDict
+
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Casefolded text with punctuation and whitespace collapsed to single spaces."""
+    return NON_WORD_RE.sub(" ", text.casefold()).strip()
+
+
+def words(text: str) -> tuple[str, ...]:
+    return tuple(normalize(text).split())
+
+
+def shingles(text: str, size: int = 4) -> frozenset[str]:
+    """Character shingles of the casefolded text with punctuation collapsed."""
+    normalized = normalize(text)
+    if len(normalized) <= size:
+        return frozenset([normalized])
+    return frozenset(normalized[i:i + size] for i in range(len(normalized) - size + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    """Bounded MinHash/LSH index mapping inputs to their refinements."""
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 5000, bands: int = 16, rows: int = 4):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.bands = bands
+        self.rows = rows
+        # The index lives in one process, so the built-in string hash XORed with
+        # fixed random masks is a cheap stand-in for independent permutations.
+        rng = random.Random(0x5EED)
+        self._masks = [rng.getrandbits(64) for _ in range(bands * rows)]
+        self._entries: OrderedDict[int, tuple[tuple, frozenset, list[int], tuple, dict]] = OrderedDict()
+        self._buckets: dict[tuple, set[int]] = {}
+        self._next_id = 0
+        self.stats = {"lookups": 0, "hits": 0, "saved_upstream_calls": 0, "saved_tokens_estimate": 0}
+
+    def _signature(self, shingle_set: frozenset) -> list[int]:
+        hashes = [hash(s) & 0xFFFFFFFFFFFFFFFF for s in shingle_set]
+        return [min([h ^ mask for h in hashes]) for mask in self._masks]
+
+    def _band_keys(self, partition: tuple, signature: list[int]):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield (partition, band, tuple(signature[start:start + self.rows]))
+
+    def lookup(self, text: str, partition: tuple) -> tuple[dict | None, float]:
+        """Return (refinement, similarity) for the closest entry above the threshold."""
+        self.stats["lookups"] += 1
+        query = shingles(text)
+        query_words = words(text)
+        signature = self._signature(query)
+
+        candidates = set()
+        for key in self._band_keys(partition, signature):
+            candidates.update(self._buckets.get(key, ()))
+
+        best_id, best_similarity = None, 0.0
+        for entry_id in candidates:
+            _, entry_shingles, _, entry_words, _ = self._entries[entry_id]
+            if entry_words != query_words:
+                continue
+            similarity = jaccard(query, entry_shingles)
+            if similarity > best_similarity:
+                best_id, best_similarity = entry_id, similarity
+
+        if best_id is None or best_similarity < self.threshold:
+            return None, best_similarity
+
+        self._entries.move_to_end(best_id)
+        self.stats["hits"] += 1
+        return self._entries[best_id][4], best_similarity
+
+    def add(self, text: str, partition: tuple, refinement: dict):
+        shingle_set = shingles(text)
+        signature = self._signature(shingle_set)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (partition, shingle_set, signature, words(text), refinement)
+        for key in self._band_keys(partition, signature):
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        entry_id, (partition, _, signature, _, _) = self._entries.popitem(last=False)
+        for key in self._band_keys(partition, signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def record_savings(self, upstream_calls: int, tokens: int):
+        self.stats["saved_upstream_calls"] += upstream_calls
+        self.stats["saved_tokens_estimate"] += tokens
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
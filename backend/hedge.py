@@ -0,0 +1,125 @@
+"""
+Hedged requests for tail latency.
+
+If a call has not answered by the time most calls of its kind have (a
+percentile of recent latencies for its key), `HedgePolicy.run` sends a
+duplicate and takes whichever answer arrives first, cancelling the other.
+The duplicate may go to a different (faster) model; that is up to the
+`attempt` callable. Hedges are capped at `max_fraction` of calls so a slow
+upstream does not see its load multiplied; a hedge is counted against the
+cap as it is launched, so concurrent slow calls cannot all slip under it.
+"""
+import asyncio
+from collections import deque
+
+
+class LatencyWindow:
+    """The last `size` latencies of one call site."""
+
+    def __init__(self, size: int = 200):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+
+    def percentile(self, pct: float) -> float:
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
+
+def _retrieve(task: asyncio.Task):
+    # A loser that failed while the winner was returning: don't warn about it.
+    task.cancelled() or task.exception()
+
+
+async def hedged(attempt, delay: float | None, reserve=None) -> tuple[object, str]:
+    """
+    Run `attempt(False)`; if it is still pending after `delay` seconds, also
+    run `attempt(True)`, provided `reserve()` (when given) agrees. Returns
+    (first successful result, outcome) where outcome is "unhedged", "primary"
+    or "hedge". Fails only if every attempt that was started fails, with the
+    primary's error.
+    """
+    primary = asyncio.ensure_future(attempt(False))
+    primary.add_done_callback(_retrieve)
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return primary.result(), "unhedged"
+        if reserve is not None and not reserve():
+            return await primary, "unhedged"
+
+        backup = asyncio.ensure_future(attempt(True))
+        backup.add_done_callback(_retrieve)
+        tasks.append(backup)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), "hedge" if task is backup else "primary"
+        return primary.result(), "primary"  # re-raises the primary's error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class HedgePolicy:
+    def __init__(self, percentile: float = 95, min_delay: float = 0.5, min_samples: int = 20,
+                 max_fraction: float = 0.1, window: int = 200):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_fraction = max_fraction
+        self.window = window
+        self.latencies: dict[str, LatencyWindow] = {}
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0}
+
+    def delay(self, key: str, budget: float | None = None) -> float | None:
+        """How long to wait before hedging a `key` call, or None to not hedge it."""
+        samples = self.latencies.get(key)
+        if samples is None or len(samples.samples) < self.min_samples:
+            return None
+        if not self._has_room():
+            return None
+        delay = max(self.min_delay, samples.percentile(self.percentile))
+        # A hedge that cannot finish within the budget only adds load.
+        if budget is not None and delay >= budget:
+            return None
+        return delay
+
+    def _has_room(self) -> bool:
+        # "hedged" counts hedges from the moment they are launched.
+        return self.stats["hedged"] < self.max_fraction * self.stats["calls"]
+
+    def _reserve(self) -> bool:
+        """Count a hedge about to be launched, unless that would exceed the cap."""
+        if not self._has_room():
+            return False
+        self.stats["hedged"] += 1
+        return True
+
+    async def run(self, key: str, attempt, allow: bool = True, budget: float | None = None):
+        """`hedged(attempt, ...)` with this policy's delay for `key`; returns (result, outcome)."""
+        if not allow:
+            return await attempt(False), "unhedged"
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.stats["calls"] += 1
+        result, outcome = await hedged(attempt, self.delay(key, budget), self._reserve)
+        if outcome != "unhedged":
+            self.stats["hedge_wins" if outcome == "hedge" else "primary_wins"] += 1
+        self.latencies.setdefault(key, LatencyWindow(self.window)).record(loop.time() - started)
+        return result, outcome
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "hedge_delay_ms": {
+                key: round(max(self.min_delay, w.percentile(self.percentile)) * 1000, 1)
+                for key, w in self.latencies.items() if len(w.samples) >= self.min_samples
+            },
+        }
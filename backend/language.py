@@ -0,0 +1,298 @@
+"""
+Offline language detection for prompt text.
+
+Text in a non-Latin script is identified from Unicode ranges alone. Latin
+text is scored against character n-gram and short-word profiles built once
+at import time from the sample corpora below (naive Bayes, add-one
+smoothing). `detect` returns the ISO code together with a confidence in
+[0, 1] so callers can decide when to fall back to a slower detector.
+"""
+import math
+import re
+from collections import Counter
+
+# --- Script ranges ---
+# (first code point, last code point, script)
+SCRIPT_RANGES = [
+    (0x0041, 0x024F, "latin"),
+    (0x1E00, 0x1EFF, "latin"),
+    (0x0370, 0x03FF, "greek"),
+    (0x0400, 0x04FF, "cyrillic"),
+    (0x0590, 0x05FF, "hebrew"),
+    (0x0600, 0x06FF, "arabic"),
+    (0x0900, 0x097F, "devanagari"),
+    (0x0E00, 0x0E7F, "thai"),
+    (0x3040, 0x30FF, "kana"),
+    (0x4E00, 0x9FFF, "han"),
+    (0xAC00, 0xD7AF, "hangul"),
+]
+
+# Scripts that map to a single language we care about.
+SCRIPT_LANGUAGES = {
+    "greek": "el",
+    "hebrew": "he",
+    "arabic": "ar",
+    "devanagari": "hi",
+    "thai": "th",
+    "hangul": "ko",
+    "kana": "ja",
+    "han": "zh",
+}
+
+UKRAINIAN_LETTERS = set("іїєґ")
+
+# --- Latin-script training samples ---
+SAMPLES = {
+    "en": """
+Write a marketing email for our new product launch and make sure the tone is friendly but professional.
+Explain how this function works and what the inputs and outputs should be.
+Create a business strategy for a small company that wants to grow its revenue over the next three years.
+I need a lesson plan that teaches students how to write clear and persuasive essays.
+Can you help me design a landing page that converts visitors into paying customers?
+Summarize the key points of this report and recommend what the team should do next.
+The audience is our existing customers, and we want them to upgrade to the premium plan.
+Please give me a list of ideas for a social media campaign about healthy eating.
+What are the risks of moving our infrastructure to the cloud, and how should we plan the migration?
+Generate a short story about a dragon who is afraid of flying, written for young children.
+Make it shorter, keep it under two hundred words, and avoid technical jargon where possible.
+This is for the sales team, who will use it with clients during the first meeting.
+""",
+    "es": """
+Escribe un correo de marketing para el lanzamiento de nuestro nuevo producto con un tono cercano pero profesional.
+Explica cómo funciona esta función y cuáles deben ser las entradas y las salidas.
+Crea una estrategia de negocio para una empresa pequeña que quiere aumentar sus ingresos en los próximos tres años.
+Necesito un plan de clase que enseñe a los estudiantes a escribir ensayos claros y persuasivos.
+¿Puedes ayudarme a diseñar una página de inicio que convierta a los visitantes en clientes?
+Resume los puntos clave de este informe y recomienda lo que el equipo debería hacer después.
+El público son nuestros clientes actuales y queremos que se pasen al plan premium.
+Por favor, dame una lista de ideas para una campaña en redes sociales sobre la alimentación saludable.
+¿Cuáles son los riesgos de llevar nuestra infraestructura a la nube y cómo deberíamos planificar la migración?
+Genera un cuento corto sobre un dragón que tiene miedo de volar, escrito para niños pequeños.
+Hazlo más corto, con menos de doscientas palabras, y evita la jerga técnica siempre que sea posible.
+Esto es para el equipo de ventas, que lo usará con los clientes durante la primera reunión.
+Quiero mejorar mi presentación para la reunión con los inversores de la próxima semana.
+Dame algunos consejos para que mi texto sea más claro y tenga un estilo más directo.
+Mi jefe me pidió un resumen de los resultados del mes, pero no sé por dónde empezar.
+""",
+    "no": """
+Skriv en markedsføringsepost for lanseringen av det nye produktet vårt, og sørg for at tonen er vennlig men profesjonell.
+Forklar hvordan denne funksjonen virker og hva inndata og utdata skal være.
+Lag en forretningsstrategi for et lite selskap som ønsker å øke inntektene sine de neste tre årene.
+Jeg trenger en undervisningsplan som lærer elevene å skrive tydelige og overbevisende stiler.
+Kan du hjelpe meg med å designe en landingsside som gjør besøkende om til betalende kunder?
+Oppsummer hovedpunktene i denne rapporten og anbefal hva teamet bør gjøre videre.
+Målgruppen er de eksisterende kundene våre, og vi ønsker at de skal oppgradere til premiumplanen.
+Gi meg en liste med ideer til en kampanje i sosiale medier om sunt kosthold.
+Hva er risikoene ved å flytte infrastrukturen vår til skyen, og hvordan bør vi planlegge overgangen?
+Lag en kort fortelling om en drage som er redd for å fly, skrevet for små barn.
+Gjør den kortere, hold den under to hundre ord, og unngå teknisk sjargong der det er mulig.
+Dette er for salgsavdelingen, som skal bruke det sammen med kundene i det første møtet.
+Jeg vil forbedre presentasjonen min til møtet med investorene neste uke.
+Gi meg noen tips slik at teksten min blir tydeligere og får en mer direkte stil.
+Sjefen min ba om en oppsummering av resultatene for måneden, men jeg vet ikke hvor jeg skal begynne.
+""",
+    "da": """
+Skriv en marketingmail til lanceringen af vores nye produkt, og sørg for at tonen er venlig men professionel.
+Forklar hvordan denne funktion virker, og hvad input og output skal være.
+Lav en forretningsstrategi for en lille virksomhed, der gerne vil øge sin omsætning over de næste tre år.
+Jeg har brug for en undervisningsplan, der lærer eleverne at skrive klare og overbevisende opgaver.
+Kan du hjælpe mig med at designe en landingsside, der får besøgende til at blive betalende kunder?
+Opsummer de vigtigste punkter i denne rapport, og anbefal hvad holdet bør gøre bagefter.
+Målgruppen er vores nuværende kunder, og vi vil gerne have dem til at opgradere til premiumplanen.
+Giv mig en liste med idéer til en kampagne på sociale medier om sund kost.
+Hvad er risiciene ved at flytte vores infrastruktur til skyen, og hvordan skal vi planlægge overgangen?
+Lav en kort historie om en drage, der er bange for at flyve, skrevet til små børn.
+Gør den kortere, hold den under to hundrede ord, og undgå teknisk jargon hvor det er muligt.
+Det er til salgsafdelingen, som skal bruge det sammen med kunderne ved det første møde.
+Jeg vil gerne forbedre min præsentation til mødet med investorerne i næste uge.
+Giv mig nogle gode råd, så min tekst bliver tydeligere og får en mere direkte stil.
+Min chef bad om en opsummering af månedens resultater, men jeg ved ikke, hvor jeg skal begynde.
+""",
+    "sv": """
+Skriv ett marknadsföringsmejl för lanseringen av vår nya produkt och se till att tonen är vänlig men professionell.
+Förklara hur den här funktionen fungerar och vad indata och utdata ska vara.
+Skapa en affärsstrategi för ett litet företag som vill öka sina intäkter under de kommande tre åren.
+Jag behöver en lektionsplan som lär eleverna att skriva tydliga och övertygande uppsatser.
+Kan du hjälpa mig att designa en landningssida som gör besökare till betalande kunder?
+Sammanfatta de viktigaste punkterna i rapporten och rekommendera vad teamet borde göra härnäst.
+Målgruppen är våra befintliga kunder, och vi vill att de ska uppgradera till premiumplanen.
+Ge mig en lista med idéer till en kampanj i sociala medier om hälsosam kost.
+Vilka är riskerna med att flytta vår infrastruktur till molnet, och hur ska vi planera övergången?
+Skriv en kort berättelse om en drake som är rädd för att flyga, skriven för små barn.
+Gör den kortare, håll den under tvåhundra ord och undvik teknisk jargong där det är möjligt.
+Det här är till säljavdelningen, som ska använda det tillsammans med kunderna vid det första mötet.
+""",
+    "nl": """
+Schrijf een marketingmail voor de lancering van ons nieuwe product en zorg dat de toon vriendelijk maar professioneel is.
+Leg uit hoe deze functie werkt en wat de invoer en de uitvoer moeten zijn.
+Maak een bedrijfsstrategie voor een klein bedrijf dat zijn omzet in de komende drie jaar wil laten groeien.
+Ik heb een lesplan nodig dat leerlingen leert om duidelijke en overtuigende essays te schrijven.
+Kun je me helpen een landingspagina te ontwerpen die bezoekers omzet in betalende klanten?
+Vat de belangrijkste punten van dit rapport samen en adviseer wat het team hierna moet doen.
+De doelgroep bestaat uit onze huidige klanten, en we willen dat ze overstappen naar het premiumabonnement.
+Geef me een lijst met ideeën voor een campagne op sociale media over gezond eten.
+Wat zijn de risico's van het verhuizen van onze infrastructuur naar de cloud, en hoe moeten we de migratie plannen?
+Schrijf een kort verhaal over een draak die bang is om te vliegen, geschreven voor jonge kinderen.
+Maak het korter, houd het onder de tweehonderd woorden en vermijd technisch jargon waar dat kan.
+Dit is voor het verkoopteam, dat het tijdens het eerste gesprek met klanten zal gebruiken.
+""",
+    "af": """
+Skryf 'n bemarkingsepos vir die bekendstelling van ons nuwe produk en maak seker dat die toon vriendelik maar professioneel is.
+Verduidelik hoe hierdie funksie werk en wat die insette en uitsette moet wees.
+Skep 'n sakestrategie vir 'n klein maatskappy wat sy inkomste oor die volgende drie jaar wil laat groei.
+Ek het 'n lesplan nodig wat leerders leer om duidelike en oortuigende opstelle te skryf.
+Kan jy my help om 'n landingsbladsy te ontwerp wat besoekers in betalende kliënte verander?
+Som die belangrikste punte van hierdie verslag op en beveel aan wat die span volgende moet doen.
+Die teikengehoor is ons bestaande kliënte, en ons wil hê hulle moet na die premiumplan opgradeer.
+Gee my asseblief 'n lys idees vir 'n veldtog op sosiale media oor gesonde eetgewoontes.
+Wat is die risiko's daarvan om ons infrastruktuur na die wolk te skuif, en hoe moet ons die oorskakeling beplan?
+Skryf 'n kort storie oor 'n draak wat bang is om te vlieg, geskryf vir klein kindertjies.
+Maak dit korter, hou dit onder tweehonderd woorde en vermy tegniese jargon waar dit moontlik is.
+Dit is vir die verkoopspan, wat dit saam met kliënte tydens die eerste vergadering sal gebruik.
+""",
+    "de": """
+Schreibe eine Marketing-E-Mail für die Einführung unseres neuen Produkts und achte darauf, dass der Ton freundlich, aber professionell ist.
+Erkläre, wie diese Funktion arbeitet und was die Eingaben und Ausgaben sein sollen.
+Erstelle eine Geschäftsstrategie für ein kleines Unternehmen, das seinen Umsatz in den nächsten drei Jahren steigern möchte.
+Ich brauche einen Unterrichtsplan, der den Schülern beibringt, klare und überzeugende Aufsätze zu schreiben.
+Kannst du mir helfen, eine Landingpage zu gestalten, die Besucher zu zahlenden Kunden macht?
+Fasse die wichtigsten Punkte dieses Berichts zusammen und empfiehl, was das Team als Nächstes tun sollte.
+Die Zielgruppe sind unsere bestehenden Kunden, und wir möchten, dass sie auf den Premium-Tarif wechseln.
+Gib mir bitte eine Liste mit Ideen für eine Kampagne in den sozialen Medien über gesunde Ernährung.
+Welche Risiken hat der Umzug unserer Infrastruktur in die Cloud, und wie sollten wir die Migration planen?
+Schreibe eine kurze Geschichte über einen Drachen, der Angst vor dem Fliegen hat, für kleine Kinder.
+Mach es kürzer, bleib unter zweihundert Wörtern und vermeide Fachjargon, wo es möglich ist.
+Das ist für das Vertriebsteam, das es beim ersten Termin mit Kunden verwenden wird.
+""",
+    "fr": """
+Rédige un e-mail marketing pour le lancement de notre nouveau produit et veille à ce que le ton soit chaleureux mais professionnel.
+Explique comment fonctionne cette fonction et quelles doivent être les entrées et les sorties.
+Crée une stratégie commerciale pour une petite entreprise qui souhaite augmenter son chiffre d'affaires au cours des trois prochaines années.
+J'ai besoin d'un plan de cours qui apprend aux élèves à écrire des dissertations claires et convaincantes.
+Peux-tu m'aider à concevoir une page d'accueil qui transforme les visiteurs en clients payants ?
+Résume les points essentiels de ce rapport et recommande ce que l'équipe devrait faire ensuite.
+Le public cible est composé de nos clients actuels, et nous voulons qu'ils passent à l'offre premium.
+Donne-moi une liste d'idées pour une campagne sur les réseaux sociaux à propos de l'alimentation saine.
+Quels sont les risques liés au transfert de notre infrastructure vers le cloud, et comment devons-nous planifier la migration ?
+Écris une courte histoire sur un dragon qui a peur de voler, destinée aux jeunes enfants.
+Fais plus court, reste sous les deux cents mots et évite le jargon technique autant que possible.
+C'est pour l'équipe commerciale, qui l'utilisera avec les clients lors du premier rendez-vous.
+""",
+    "pt": """
+Escreva um e-mail de marketing para o lançamento do nosso novo produto e garanta que o tom seja simpático, mas profissional.
+Explique como esta função funciona e quais devem ser as entradas e as saídas.
+Crie uma estratégia de negócios para uma pequena empresa que quer aumentar a sua receita nos próximos três anos.
+Preciso de um plano de aula que ensine os alunos a escrever redações claras e persuasivas.
+Você pode me ajudar a criar uma página de destino que transforme visitantes em clientes pagantes?
+Resuma os pontos principais deste relatório e recomende o que a equipe deve fazer a seguir.
+O público são os nossos clientes atuais, e queremos que eles mudem para o plano premium.
+Por favor, me dê uma lista de ideias para uma campanha nas redes sociais sobre alimentação saudável.
+Quais são os riscos de levar a nossa infraestrutura para a nuvem, e como devemos planejar a migração?
+Gere uma história curta sobre um dragão que tem medo de voar, escrita para crianças pequenas.
+Deixe mais curto, com menos de duzentas palavras, e evite jargão técnico sempre que possível.
+Isto é para a equipe de vendas, que vai usar com os clientes durante a primeira reunião.
+Quero melhorar a minha apresentação para a reunião com os investidores na próxima semana.
+Dê-me algumas dicas para deixar o meu texto mais claro e com um estilo mais direto.
+O meu chefe pediu um resumo dos resultados do mês, mas não sei por onde começar.
+""",
+    "it": """
+Scrivi un'email di marketing per il lancio del nostro nuovo prodotto e assicurati che il tono sia cordiale ma professionale.
+Spiega come funziona questa funzione e quali devono essere gli input e gli output.
+Crea una strategia aziendale per una piccola impresa che vuole aumentare il proprio fatturato nei prossimi tre anni.
+Ho bisogno di un piano di lezione che insegni agli studenti a scrivere temi chiari e persuasivi.
+Puoi aiutarmi a progettare una pagina di destinazione che trasformi i visitatori in clienti paganti?
+Riassumi i punti principali di questo rapporto e consiglia cosa dovrebbe fare il team in seguito.
+Il pubblico sono i nostri clienti attuali, e vogliamo che passino al piano premium.
+Per favore, dammi un elenco di idee per una campagna sui social media sull'alimentazione sana.
+Quali sono i rischi di spostare la nostra infrastruttura nel cloud, e come dovremmo pianificare la migrazione?
+Genera un breve racconto su un drago che ha paura di volare, scritto per bambini piccoli.
+Rendilo più breve, sotto le duecento parole, ed evita il gergo tecnico quando possibile.
+Questo è per il team di vendita, che lo userà con i clienti durante il primo incontro.
+""",
+}
+
+WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?|'n\b")
+MAX_NGRAM = 3
+WORD_WEIGHT = 3.0  # a matching short word says more than any single n-gram
+
+
+def _features(text: str) -> list[str]:
+    """Character 1-3 grams of each padded word, plus the words themselves."""
+    features = []
+    for word in WORD_RE.findall(text.lower()):
+        padded = f" {word} "
+        for n in range(1, MAX_NGRAM + 1):
+            features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        features.append(f"w:{word}")
+    return features
+
+
+def _build_tables() -> tuple[list[str], dict[str, list[float]], list[float]]:
+    """Per-feature log-probabilities for every language, plus the unseen-feature floor."""
+    codes = list(SAMPLES)
+    counts = {code: Counter(_features(sample)) for code, sample in SAMPLES.items()}
+    vocabulary = set()
+    for profile in counts.values():
+        vocabulary.update(profile)
+    denominators = [math.log(sum(counts[code].values()) + len(vocabulary)) for code in codes]
+    unseen = [-d for d in denominators]
+    tables = {
+        feature: [math.log(counts[code][feature] + 1) - d for code, d in zip(codes, denominators)]
+        for feature in vocabulary
+    }
+    return codes, tables, unseen
+
+
+LANGUAGES, FEATURE_LOGPROBS, UNSEEN_LOGPROBS = _build_tables()
+
+
+def dominant_script(text: str) -> str | None:
+    """Return the script covering most letters in `text`, or None if there are none."""
+    counts = Counter()
+    for ch in text:
+        cp = ord(ch)
+        if cp < 0x41:
+            continue
+        for first, last, script in SCRIPT_RANGES:
+            if first <= cp <= last:
+                counts[script] += 1
+                break
+    if not counts:
+        return None
+    # Japanese mixes kana and kanji; any kana at all settles it.
+    if counts["kana"] and counts["han"]:
+        return "kana"
+    return counts.most_common(1)[0][0]
+
+
+def score_latin(text: str) -> dict[str, float]:
+    """Log-likelihood of `text` under each Latin-script profile."""
+    scores = [0.0] * len(LANGUAGES)
+    for feature, count in Counter(_features(text)).items():
+        weight = count * (WORD_WEIGHT if feature.startswith("w:") else 1.0)
+        logprobs = FEATURE_LOGPROBS.get(feature, UNSEEN_LOGPROBS)
+        scores = [score + weight * lp for score, lp in zip(scores, logprobs)]
+    return dict(zip(LANGUAGES, scores))
+
+
+def detect(text: str) -> tuple[str, float]:
+    """Detect the language of `text` and return (ISO code, confidence)."""
+    script = dominant_script(text)
+    if script is None:
+        return "en", 0.0
+    if script == "cyrillic":
+        if UKRAINIAN_LETTERS & set(text.lower()):
+            return "uk", 0.9
+        # Russian is the best guess, but other Cyrillic languages look alike.
+        return "ru", 0.75
+    if script != "latin":
+        return SCRIPT_LANGUAGES[script], 0.95
+
+    scores = score_latin(text)
+    if not scores:
+        return "en", 0.0
+    best_score = max(scores.values())
+    weights = {code: math.exp(score - best_score) for code, score in scores.items()}
+    total = sum(weights.values())
+    code = max(weights, key=weights.get)
+    return code, weights[code] / total
@@ -0,0 +1,239 @@
+"""
+Adaptive concurrency limiting, load shedding and circuit breaking for
+upstream model calls.
+
+`AdaptiveLimiter` caps concurrent upstream calls with an AIMD limit. Each
+call site keeps two moving averages of its latency: a slow one (the
+baseline) and a fast one (recent). While recent stays within `tolerance`
+times the baseline, each call made while the limiter is at least half
+full (or has callers queued) raises the limit by 1/limit, so roughly +1 per
+limit's worth of busy calls; a quiet period leaves the limit where it is. Recent latency beyond that, or an overload
+error (rate limit, timeout, 5xx), multiplies it by `backoff`, at most once
+per baseline interval. Comparing averages rather than single calls keeps a
+heavy-tailed but healthy upstream from being mistaken for a queueing one.
+Callers beyond the limit wait in a bounded FIFO queue. They are shed with
+`Overloaded` when the queue is full or their wait exceeds `queue_timeout`,
+so a spike turns into fast 503s instead of requests piling up until the
+upstream timeout.
+
+`CircuitBreaker` opens after `failure_threshold` consecutive overload errors
+and rejects calls for `reset_timeout` seconds. It then lets one probe
+through (half-open) and closes again if the probe succeeds.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    """The upstream is saturated or failing; retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Upstream overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial_limit: int = 20, min_limit: int = 1, max_limit: int = 200,
+                 max_queue: int = 100, queue_timeout: float = 5.0, tolerance: float = 2.0, backoff: float = 0.9):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self.baselines: dict[str, float] = {}
+        self.recent: dict[str, float] = {}
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.stats = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_queue_timeout": 0,
+                      "increases": 0, "decreases": 0}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        """Rough time for the current queue to drain at the current limit."""
+        typical = max(self.baselines.values(), default=1.0)
+        return typical * (self.queued + 1) / max(self.limit, 1.0)
+
+    def check(self):
+        """Raise Overloaded if a call arriving now would be shed immediately."""
+        if self.in_flight >= int(self.limit) and self.queued >= self.max_queue:
+            raise Overloaded("queue_full", self.retry_after())
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return
+        if self.queued >= self.max_queue:
+            self.stats["shed_queue_full"] += 1
+            raise Overloaded("queue_full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # The slot may have been handed over just as the wait timed out.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            self.stats["shed_queue_timeout"] += 1
+            raise Overloaded("queue_timeout", self.retry_after()) from None
+        except asyncio.CancelledError:
+            # Likewise when cancelled.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.stats["admitted"] += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def record(self, key: str, latency: float, overloaded: bool):
+        """Adjust the limit from one finished call to the `key` call site, before its release."""
+        baseline = self.baselines.get(key)
+        slow = False
+        if not overloaded:
+            recent = self.recent.get(key)
+            recent = latency if recent is None else recent * 0.8 + latency * 0.2
+            self.recent[key] = recent
+            slow = baseline is not None and recent > baseline * self.tolerance
+            self.baselines[key] = latency if baseline is None else baseline * 0.98 + latency * 0.02
+
+        now = time.monotonic()
+        if overloaded or slow:
+            if now - self._last_decrease >= (baseline or 1.0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+                self.stats["decreases"] += 1
+        elif self.limit < self.max_limit and (self.in_flight >= self.limit / 2 or self._waiters):
+            # Only a limit that is actually in use has shown it can go higher.
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.stats["increases"] += 1
+            self._wake()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self.queued,
+            "baseline_latency_ms": {k: round(v * 1000, 1) for k, v in self.baselines.items()},
+            "recent_latency_ms": {k: round(v * 1000, 1) for k, v in self.recent.items()},
+        }
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def _refresh(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+
+    def check(self):
+        """Raise Overloaded while open; a half-open circuit lets callers through to try_call."""
+        self._refresh()
+        if self.state == "open":
+            self.stats["rejected"] += 1
+            raise Overloaded("circuit_open", self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def try_call(self):
+        """Admit a call, allowing only one probe at a time while half-open."""
+        self.check()
+        if self.state == "half_open":
+            if self._probing:
+                self.stats["rejected"] += 1
+                raise Overloaded("circuit_open", 1.0)
+            self._probing = True
+
+    def abandon(self):
+        """A call admitted by try_call ended without a verdict."""
+        self._probing = False
+
+    def record(self, ok: bool):
+        self._probing = False
+        if ok:
+            self.failures = 0
+            self.state = "closed"
+            return
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        self._refresh()
+        return {**self.stats, "state": self.state, "consecutive_failures": self.failures}
+
+
+class UpstreamGuard:
+    """Limiter and breaker combined around one upstream call."""
+
+    def __init__(self, limiter: AdaptiveLimiter, breaker: CircuitBreaker, is_overload):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.is_overload = is_overload
+
+    def check(self):
+        """Raise Overloaded if a new call would be rejected right now."""
+        self.breaker.check()
+        self.limiter.check()
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        self.breaker.check()
+        await self.limiter.acquire()
+        try:
+            self.breaker.try_call()
+        except Overloaded:
+            self.limiter.release()
+            raise
+
+        started = time.monotonic()
+        outcome = None
+        try:
+            yield
+            outcome = False
+        except Exception as e:
+            outcome = bool(self.is_overload(e))
+            raise
+        finally:
+            if outcome is None:
+                # Cancelled (e.g. client went away): no signal either way.
+                self.breaker.abandon()
+            else:
+                self.limiter.record(key, time.monotonic() - started, outcome)
+                self.breaker.record(not outcome)
+            self.limiter.release()
+
+    def snapshot(self) -> dict:
+        return {"limiter": self.limiter.snapshot(), "breaker": self.breaker.snapshot()}
@@ -0,0 +1,278 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms keyed by label values, plus a `timed(stage)`
+context manager that feeds the stage histogram and, while a request is
+being served, that request's own timing breakdown (used for the optional
+Server-Timing header).
+
+Metrics live in each worker process. With several workers behind one port,
+`SharedMetrics` makes every scrape see all of them: each worker writes its
+values to a file in a shared directory (periodically and when it is
+scraped), and the scraped worker merges the files. Counters and histograms
+are summed, including those of workers that have exited; gauges are kept
+per live worker under a `worker` label.
+"""
+import contextvars
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self, values: dict | None = None, labelnames: tuple | None = None) -> list[str]:
+        """Exposition lines for this metric's values, or for merged `values` with `labelnames`."""
+        values = self.values() if values is None else values
+        labelnames = self.labelnames if labelnames is None else labelnames
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key in sorted(values):
+            lines.extend(self._samples(labelnames, key, values[key]))
+        return lines
+
+    def values(self) -> dict:
+        """Current values by label values, with scrape-time functions evaluated."""
+        return {key: value() if callable(value) else value for key, value in self._values.items()}
+
+    def _samples(self, labelnames: tuple, key: tuple, value) -> list[str]:
+        return [f"{self.name}{format_labels(labelnames, key)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        """Read the value from `function()` at scrape time."""
+        self._values[self._key(labels)] = function
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the enclosed block as in progress."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state["counts"][i] += 1
+                break
+        state["sum"] += value
+        state["count"] += 1
+
+    def _samples(self, labelnames: tuple, key: tuple, state: dict) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state["counts"]):
+            cumulative += count
+            le = f'le="{format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{format_labels(labelnames, key, le)} {cumulative}")
+        labels = format_labels(labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self) -> dict:
+        """Every metric's current values, JSON-serializable."""
+        return {name: [[list(key), value] for key, value in metric.values().items()]
+                for name, metric in self._metrics.items()}
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """One registry's values shared across worker processes through a directory."""
+
+    def __init__(self, registry: Registry, directory: str):
+        self.registry = registry
+        self.directory = directory
+        self.path = os.path.join(directory, f"worker-{os.getpid()}.json")
+
+    def write(self):
+        """Publish this worker's values (atomically, so readers never see a partial file)."""
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.registry.dump(), f)
+        os.replace(temporary, self.path)
+
+    def _read(self) -> dict[int, dict]:
+        dumps = {}
+        for name in os.listdir(self.directory):
+            if not (name.startswith("worker-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    dumps[int(name[len("worker-"):-len(".json")])] = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced or from an unrelated process
+        return dumps
+
+    def render(self) -> str:
+        """Exposition text merged over every worker's latest values, this worker's current ones included."""
+        self.write()
+        dumps = self._read()
+        lines = []
+        for name, metric in self.registry._metrics.items():
+            merged: dict[tuple, object] = {}
+            for pid, dump in dumps.items():
+                if isinstance(metric, Gauge):
+                    if not _alive(pid):
+                        continue
+                    for key, value in dump.get(name, []):
+                        merged[(*key, str(pid))] = value
+                    continue
+                for key, value in dump.get(name, []):
+                    key = tuple(key)
+                    if isinstance(metric, Histogram):
+                        state = merged.setdefault(key, {"counts": [0] * len(metric.buckets), "sum": 0.0, "count": 0})
+                        state["counts"] = [a + b for a, b in zip(state["counts"], value["counts"])]
+                        state["sum"] += value["sum"]
+                        state["count"] += value["count"]
+                    else:
+                        merged[key] = merged.get(key, 0) + value
+            labelnames = (*metric.labelnames, "worker") if isinstance(metric, Gauge) else None
+            lines.extend(metric.render(merged, labelnames))
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+stage_seconds = registry.histogram(
+    "promptrefine_stage_duration_seconds", "Wall time of each pipeline stage.", ("stage",)
+)
+
+# Stage timings of the request being served, or None outside a request.
+request_timings: contextvars.ContextVar[list | None] = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_stage(stage: str, seconds: float):
+    stage_seconds.observe(seconds, stage=stage)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block as `stage`, errors included."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def server_timing(timings: list[tuple[str, float]], total: float | None = None) -> str:
+    """Server-Timing header value; repeated stages are summed and counted."""
+    durations: dict[str, list[float]] = {}
+    for stage, seconds in timings:
+        durations.setdefault(stage, []).append(seconds)
+    parts = []
+    for stage, values in durations.items():
+        desc = f';desc="x{len(values)}"' if len(values) > 1 else ""
+        parts.append(f"{stage};dur={sum(values) * 1000:.1f}{desc}")
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
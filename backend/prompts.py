@@ -0,0 +1,32 @@
+"""
+Message layout for the LLM call sites.
+
+Providers cache long prompt prefixes, but only byte-identical ones. Each
+template therefore sends its instructions first, as system messages built
+once at import time, and keeps everything that varies per request in the
+final user message. `prefix_id` hashes the static part so usage stats can
+be matched to the prompt version that produced them.
+"""
+from cache import fingerprint
+
+
+class MessageTemplate:
+    def __init__(self, name: str, system: str | list[str], user: str):
+        self.name = name
+        self.system = (system,) if isinstance(system, str) else tuple(system)
+        self.user = user
+        self.prefix_id = fingerprint(*self.system)
+        # Everything that shapes the messages, for cache settings fingerprints.
+        self.version = fingerprint(self.prefix_id, user)
+        self._prefix = tuple({"role": "system", "content": part} for part in self.system)
+
+    def render(self, **fields) -> str:
+        """The per-request user message."""
+        return self.user.format(**fields)
+
+    def messages(self, content: str) -> list[dict]:
+        """Static system prefix followed by an already rendered user message."""
+        return [*(dict(m) for m in self._prefix), {"role": "user", "content": content}]
+
+    def build(self, **fields) -> list[dict]:
+        return self.messages(self.render(**fields))
@@ -0,0 +1,78 @@
+"""
+Precomputed context questions by category and language.
+
+The bank (question_bank.json by default, override with QUESTION_BANK_FILE)
+holds one or more sets of three questions per category and language. It is
+built offline by build_question_bank.py from logged model output and loaded
+once at startup. A lookup falls back from the exact cell to the default
+category in the same language, then to English, so a set of questions is
+always available with no upstream call.
+"""
+import hashlib
+import json
+
+QUESTION_COUNT = 3
+
+
+class QuestionBank:
+    def __init__(self, questions: dict[str, dict[str, list[list[str]]]],
+                 default_category: str = "general", default_language: str = "en"):
+        self.questions = {
+            category: {
+                language: [list(s) for s in sets if len(s) == QUESTION_COUNT]
+                for language, sets in languages.items()
+            }
+            for category, languages in questions.items()
+        }
+        self.default_category = default_category
+        self.default_language = default_language
+        self.stats = {"exact": 0, "category_fallback": 0, "language_fallback": 0, "misses": 0}
+
+    @classmethod
+    def from_file(cls, path: str, default_category: str = "general") -> "QuestionBank":
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config["questions"], default_category)
+
+    def _sets(self, category: str, language: str) -> list[list[str]]:
+        return self.questions.get(category, {}).get(language, [])
+
+    def get(self, category: str | None, language: str, seed: str = "") -> list[str] | None:
+        """
+        Questions for a category and language, or None if the bank has no
+        usable cell. `seed` picks among several sets, stably for equal input.
+        """
+        category = category or self.default_category
+        for stat, (cat, lang) in (
+            ("exact", (category, language)),
+            ("category_fallback", (self.default_category, language)),
+            ("language_fallback", (category, self.default_language)),
+            ("language_fallback", (self.default_category, self.default_language)),
+        ):
+            sets = self._sets(cat, lang)
+            if sets:
+                self.stats[stat] += 1
+                index = int.from_bytes(hashlib.blake2b(seed.encode("utf-8"), digest_size=4).digest(), "big")
+                return list(sets[index % len(sets)])
+        self.stats["misses"] += 1
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "categories": len(self.questions),
+            "cells": sum(len(languages) for languages in self.questions.values()),
+            "sets": sum(len(sets) for languages in self.questions.values() for sets in languages.values()),
+        }
+
+
+def dump(questions: dict[str, dict[str, list[list[str]]]]) -> str:
+    """Bank file contents, one question set per line so diffs stay readable."""
+    categories = []
+    for category, languages in questions.items():
+        cells = []
+        for language, sets in languages.items():
+            rows = ",\n".join("        " + json.dumps(s, ensure_ascii=False) for s in sets)
+            cells.append(f'      {json.dumps(language)}: [\n{rows}\n      ]')
+        categories.append(f'    {json.dumps(category)}: {{\n' + ",\n".join(cells) + "\n    }")
+    return '{\n  "questions": {\n' + ",\n".join(categories) + "\n  }\n}\n"
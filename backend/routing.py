@@ -0,0 +1,112 @@
+"""
+Per-stage model routing.
+
+Each call site ("stage") picks its model, temperature and max_tokens from
+an ordered list of rules in a JSON config (routing.json by default,
+override with ROUTING_FILE). A rule matches on the prompt category and the
+input length in characters; the first match wins, and its fields override
+the stage's defaults. Models are named by tier ("strong", "fast") and the
+tiers map to real model names from the environment, so the same config
+works across deployments. Decisions are counted per stage, rule and model.
+
+Reasoning models (GPT-5 family, o-series) reject `max_tokens` and any
+non-default temperature, and spend part of their output on reasoning, so
+`upstream_call` drops their temperature and sends their cap as
+`max_completion_tokens` with an allowance for reasoning on top; a stage's
+`max_tokens` always means tokens of visible answer.
+"""
+import json
+
+from cache import fingerprint
+
+REASONING_MODEL_PREFIXES = ("gpt-5", "o1", "o3", "o4")
+
+
+def is_reasoning_model(model: str) -> bool:
+    return model.lower().startswith(REASONING_MODEL_PREFIXES)
+
+
+def upstream_call(kwargs: dict, reasoning_tokens: int) -> dict:
+    """`kwargs` with the sampling and length settings the model accepts."""
+    if not is_reasoning_model(kwargs["model"]):
+        return kwargs
+    call = dict(kwargs)
+    call.pop("temperature", None)
+    if "max_tokens" in call:
+        call["max_completion_tokens"] = call.pop("max_tokens") + reasoning_tokens
+    return call
+
+
+class Route:
+    def __init__(self, rule: str, model: str, temperature: float, max_tokens: int | None = None):
+        self.rule = rule
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        # A larger max_tokens to retry with if the output is cut off; set by
+        # callers that size max_tokens themselves.
+        self.retry_max_tokens: int | None = None
+
+    def call(self) -> dict:
+        """Completion keyword arguments for this route."""
+        kwargs = {"model": self.model, "temperature": self.temperature}
+        if self.max_tokens is not None:
+            kwargs["max_tokens"] = self.max_tokens
+        if self.retry_max_tokens is not None:
+            kwargs["retry_max_tokens"] = self.retry_max_tokens
+        return kwargs
+
+
+class Router:
+    def __init__(self, stages: dict, models: dict[str, str], defaults: dict[str, dict]):
+        """
+        `stages` maps a stage to its rules, `models` maps tiers to model
+        names and `defaults` gives each stage's model tier and temperature
+        when no rule overrides them.
+        """
+        self.stages = stages
+        self.models = models
+        self.defaults = defaults
+        for stage, rules in stages.items():
+            for rule in rules:
+                model = rule.get("model")
+                if model is not None and model not in models:
+                    raise ValueError(f"Routing rule {stage}/{rule.get('name')} uses unknown model tier {model!r}")
+        self.version = fingerprint(stages, models, defaults)
+        self.decisions: dict[tuple[str, str, str], int] = {}
+
+    @classmethod
+    def from_file(cls, path: str, models: dict[str, str], defaults: dict[str, dict]) -> "Router":
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config["stages"], models, defaults)
+
+    @staticmethod
+    def matches(rule: dict, category: str | None, length: int) -> bool:
+        categories = rule.get("categories")
+        if categories is not None and category not in categories:
+            return False
+        if length < rule.get("min_chars", 0):
+            return False
+        max_chars = rule.get("max_chars")
+        return max_chars is None or length <= max_chars
+
+    def route(self, stage: str, category: str | None, length: int) -> Route:
+        """The route for a `stage` call on `length` characters of `category` input."""
+        fields = dict(self.defaults[stage])
+        name = "default"
+        for i, rule in enumerate(self.stages.get(stage, [])):
+            if self.matches(rule, category, length):
+                name = rule.get("name", f"rule{i}")
+                fields.update({k: rule[k] for k in ("model", "temperature", "max_tokens") if k in rule})
+                break
+        route = Route(name, self.models[fields["model"]], fields["temperature"], fields.get("max_tokens"))
+        key = (stage, name, route.model)
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+        return route
+
+    def snapshot(self) -> dict:
+        snapshot: dict[str, dict] = {}
+        for (stage, rule, model), count in sorted(self.decisions.items()):
+            snapshot.setdefault(stage, {})[f"{rule} -> {model}"] = count
+        return snapshot
@@ -0,0 +1,317 @@
+"""
+Key-value storage backends behind the feedback endpoints and /health.
+
+Every backend exposes the same small async interface, so the API does not
+care whether it talks to Upstash over REST, to a Redis server over its
+native protocol, or to an in-process dict:
+
+- "upstash": Upstash REST API (one HTTPS request per call, shared session)
+- "redis":   native Redis protocol via redis-py, pooled and pipelined
+- "memory":  in-process dict, for tests, benchmarks and local development
+
+Pick one with STORAGE_BACKEND (default "upstash").
+"""
+import asyncio
+import fnmatch
+import os
+import time
+
+# Compare-and-delete, so a lock is only released by the owner that holds it.
+DELETE_IF_EQUAL_SCRIPT = (
+    'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+)
+
+
+class Storage:
+    """Interface shared by all storage backends."""
+
+    name = "base"
+
+    async def ping(self) -> None:
+        """Raise if the backend is unreachable."""
+        raise NotImplementedError
+
+    async def get(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    async def mget(self, *keys: str) -> list[str | None]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: float | None = None, nx: bool = False) -> bool:
+        """Set `key`, optionally expiring after `ttl` seconds or only if absent."""
+        raise NotImplementedError
+
+    async def mset(self, values: dict[str, str | int]) -> None:
+        raise NotImplementedError
+
+    async def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    async def delete_if_equal(self, key: str, value: str) -> bool:
+        """Atomically delete `key` if it still holds `value`; True if it was deleted."""
+        raise NotImplementedError
+
+    async def incrby_many(self, increments: dict[str, int]) -> list[int]:
+        """Atomically apply every increment and return the new values in order."""
+        raise NotImplementedError
+
+    async def scan(self, cursor: int, match: str, count: int) -> tuple[int, list[str]]:
+        """One page of a cursor-based SCAN; a returned cursor of 0 means done."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class UpstashStorage(Storage):
+    """Upstash Redis over its REST API."""
+
+    name = "upstash"
+
+    def __init__(self, url: str | None, token: str | None):
+        self._url = url
+        self._token = token
+        self._redis = None
+        self._session_open = False
+        self._opening = asyncio.Lock()
+
+    async def _client(self):
+        if self._session_open:
+            return self._redis
+        # The SDK is imported and its client built on first use, so creating
+        # the backend at import time costs nothing. Concurrent first calls
+        # wait for one session instead of each opening (and leaking) their own.
+        async with self._opening:
+            if self._redis is None:
+                from upstash_redis.asyncio import Redis
+
+                self._redis = Redis(url=self._url, token=self._token)
+            # Reuse one HTTP session instead of opening one per command.
+            if not self._session_open:
+                await self._redis.__aenter__()
+                self._session_open = True
+        return self._redis
+
+    async def ping(self) -> None:
+        await (await self._client()).ping()
+
+    async def get(self, key: str) -> str | None:
+        return await (await self._client()).get(key)
+
+    async def mget(self, *keys: str) -> list[str | None]:
+        return await (await self._client()).mget(*keys)
+
+    async def set(self, key: str, value: str, ttl: float | None = None, nx: bool = False) -> bool:
+        px = int(ttl * 1000) if ttl else None
+        result = await (await self._client()).set(key, value, px=px, nx=nx or None)
+        return bool(result)
+
+    async def mset(self, values: dict[str, str | int]) -> None:
+        await (await self._client()).mset(values)
+
+    async def delete(self, *keys: str) -> None:
+        await (await self._client()).delete(*keys)
+
+    async def delete_if_equal(self, key: str, value: str) -> bool:
+        return bool(await (await self._client()).eval(DELETE_IF_EQUAL_SCRIPT, keys=[key], args=[value]))
+
+    async def incrby_many(self, increments: dict[str, int]) -> list[int]:
+        tx = (await self._client()).multi()
+        for key, amount in increments.items():
+            tx.incrby(key, amount)
+        return [int(v) for v in await tx.exec()]
+
+    async def scan(self, cursor: int, match: str, count: int) -> tuple[int, list[str]]:
+        cursor, keys = await (await self._client()).scan(cursor, match=match, count=count)
+        return int(cursor), keys
+
+    async def close(self) -> None:
+        if self._session_open:
+            await self._redis.close()
+            self._session_open = False
+
+
+class RedisStorage(Storage):
+    """Native Redis protocol with a shared connection pool."""
+
+    name = "redis"
+
+    def __init__(self, url: str, max_connections: int = 50):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=redis requires the 'redis' package") from e
+
+        self._pool = aioredis.ConnectionPool.from_url(
+            url, max_connections=max_connections, decode_responses=True
+        )
+        self._redis = aioredis.Redis(connection_pool=self._pool)
+
+    async def ping(self) -> None:
+        await self._redis.ping()
+
+    async def get(self, key: str) -> str | None:
+        return await self._redis.get(key)
+
+    async def mget(self, *keys: str) -> list[str | None]:
+        return await self._redis.mget(keys)
+
+    async def set(self, key: str, value: str, ttl: float | None = None, nx: bool = False) -> bool:
+        px = int(ttl * 1000) if ttl else None
+        return bool(await self._redis.set(key, value, px=px, nx=nx))
+
+    async def mset(self, values: dict[str, str | int]) -> None:
+        await self._redis.mset(values)
+
+    async def delete(self, *keys: str) -> None:
+        await self._redis.delete(*keys)
+
+    async def delete_if_equal(self, key: str, value: str) -> bool:
+        return bool(await self._redis.eval(DELETE_IF_EQUAL_SCRIPT, 1, key, value))
+
+    async def incrby_many(self, increments: dict[str, int]) -> list[int]:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for key, amount in increments.items():
+                pipe.incrby(key, amount)
+            return [int(v) for v in await pipe.execute()]
+
+    async def scan(self, cursor: int, match: str, count: int) -> tuple[int, list[str]]:
+        cursor, keys = await self._redis.scan(cursor, match=match, count=count)
+        return int(cursor), keys
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+        await self._pool.disconnect()
+
+
+class MemoryStorage(Storage):
+    """In-process storage. Per-process only; nothing survives a restart."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._data: dict[str, str] = {}
+        self._expires: dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    def _live(self, key: str) -> str | None:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    async def ping(self) -> None:
+        pass
+
+    async def get(self, key: str) -> str | None:
+        return self._live(key)
+
+    async def mget(self, *keys: str) -> list[str | None]:
+        return [self._live(key) for key in keys]
+
+    async def set(self, key: str, value: str, ttl: float | None = None, nx: bool = False) -> bool:
+        if nx and self._live(key) is not None:
+            return False
+        self._data[key] = str(value)
+        if ttl:
+            self._expires[key] = time.monotonic() + ttl
+        else:
+            self._expires.pop(key, None)
+        return True
+
+    async def mset(self, values: dict[str, str | int]) -> None:
+        for key, value in values.items():
+            await self.set(key, str(value))
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+    async def delete_if_equal(self, key: str, value: str) -> bool:
+        if self._live(key) != value:
+            return False
+        await self.delete(key)
+        return True
+
+    async def incrby_many(self, increments: dict[str, int]) -> list[int]:
+        async with self._lock:
+            results = []
+            for key, amount in increments.items():
+                value = int(self._live(key) or 0) + amount
+                self._data[key] = str(value)
+                results.append(value)
+            return results
+
+    async def scan(self, cursor: int, match: str, count: int) -> tuple[int, list[str]]:
+        keys = sorted(k for k in list(self._data) if self._live(k) is not None and fnmatch.fnmatchcase(k, match))
+        page = keys[cursor:cursor + count]
+        next_cursor = cursor + count if cursor + count < len(keys) else 0
+        return next_cursor, page
+
+
+class TimedStorage(Storage):
+    """Wraps a backend and times every call with `timer(operation)`, a context manager factory."""
+
+    def __init__(self, inner: Storage, timer):
+        self.inner = inner
+        self.timer = timer
+        self.name = inner.name
+
+    async def ping(self) -> None:
+        with self.timer("ping"):
+            await self.inner.ping()
+
+    async def get(self, key: str) -> str | None:
+        with self.timer("get"):
+            return await self.inner.get(key)
+
+    async def mget(self, *keys: str) -> list[str | None]:
+        with self.timer("mget"):
+            return await self.inner.mget(*keys)
+
+    async def set(self, key: str, value: str, ttl: float | None = None, nx: bool = False) -> bool:
+        with self.timer("set"):
+            return await self.inner.set(key, value, ttl=ttl, nx=nx)
+
+    async def mset(self, values: dict[str, str | int]) -> None:
+        with self.timer("mset"):
+            await self.inner.mset(values)
+
+    async def delete(self, *keys: str) -> None:
+        with self.timer("delete"):
+            await self.inner.delete(*keys)
+
+    async def delete_if_equal(self, key: str, value: str) -> bool:
+        with self.timer("delete_if_equal"):
+            return await self.inner.delete_if_equal(key, value)
+
+    async def incrby_many(self, increments: dict[str, int]) -> list[int]:
+        with self.timer("incrby_many"):
+            return await self.inner.incrby_many(increments)
+
+    async def scan(self, cursor: int, match: str, count: int) -> tuple[int, list[str]]:
+        with self.timer("scan"):
+            return await self.inner.scan(cursor, match, count)
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+def create_storage(backend: str | None = None) -> Storage:
+    """Build the backend named by `backend` or STORAGE_BACKEND."""
+    backend = (backend or os.getenv("STORAGE_BACKEND", "upstash")).lower()
+    if backend == "upstash":
+        return UpstashStorage(
+            url=os.getenv("UPSTASH_REDIS_REST_URL"),
+            token=os.getenv("UPSTASH_REDIS_REST_TOKEN"),
+        )
+    if backend == "redis":
+        return RedisStorage(
+            url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+        )
+    if backend == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend!r} (expected upstash, redis or memory)")
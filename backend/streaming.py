@@ -0,0 +1,99 @@
+"""
+Helpers for the Server-Sent Events endpoints.
+
+The model answers in JSON mode, so its streamed output is a JSON object
+arriving a few characters at a time. `JSONStringFieldStream` watches that
+text and yields the decoded value of one top-level string field (for us,
+"after") as soon as each piece of it arrives, without waiting for the
+object to close.
+"""
+import json
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class JSONStringFieldStream:
+    """Incrementally extract one top-level string field from streamed JSON text."""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.depth = 0
+        self.in_string = False
+        self.escape = ""          # pending escape sequence, e.g. "\\u00e"
+        self.pending_surrogate = ""
+        self.string_chars = []    # current key being read at depth 1
+        self.is_key = True        # next depth-1 string is a key
+        self.current_key = None
+        self.capturing = False
+        self.done = False
+
+    def _decode_escape(self) -> str | None:
+        """Decode self.escape if complete, else return None."""
+        if len(self.escape) < 2:
+            return None
+        kind = self.escape[1]
+        if kind != "u":
+            return ESCAPES.get(kind, kind)
+        if len(self.escape) < 6:
+            return None
+        char = chr(int(self.escape[2:6], 16))
+        if 0xD800 <= ord(char) <= 0xDBFF:
+            self.pending_surrogate = char
+            return ""
+        if self.pending_surrogate and 0xDC00 <= ord(char) <= 0xDFFF:
+            char = (self.pending_surrogate + char).encode("utf-16", "surrogatepass").decode("utf-16")
+        self.pending_surrogate = ""
+        return char
+
+    def feed(self, chunk: str) -> str:
+        """Consume the next piece of model output; return any new text of the field."""
+        out = []
+        for ch in chunk:
+            if self.in_string:
+                if self.escape:
+                    self.escape += ch
+                    decoded = self._decode_escape()
+                    if decoded is None:
+                        continue
+                    self.escape = ""
+                    ch_out = decoded
+                elif ch == "\\":
+                    self.escape = ch
+                    continue
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.is_key:
+                        self.current_key = "".join(self.string_chars)
+                        self.string_chars = []
+                    elif self.capturing:
+                        self.capturing = False
+                        self.done = True
+                    continue
+                else:
+                    ch_out = ch
+
+                if self.capturing:
+                    out.append(ch_out)
+                elif self.depth == 1 and self.is_key:
+                    self.string_chars.append(ch_out)
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1 and not self.is_key and self.current_key == self.field:
+                    self.capturing = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+            elif ch == ":" and self.depth == 1:
+                self.is_key = False
+            elif ch == "," and self.depth == 1:
+                self.is_key = True
+                self.current_key = None
+        return "".join(out)
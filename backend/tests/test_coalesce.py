@@ -0,0 +1,121 @@
+"""
+Tests for coalesce.SingleFlight.
+
+Run from backend/:
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coalesce import CoalescedError, SingleFlight  # noqa: E402
+from deadline import DeadlineExceeded  # noqa: E402
+from limiter import Overloaded  # noqa: E402
+from storage import MemoryStorage  # noqa: E402
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Two workers sharing one storage backend.
+        storage = MemoryStorage()
+        self.leader = SingleFlight(storage, poll_interval=0.01)
+        self.other = SingleFlight(storage, poll_interval=0.01)
+
+    async def remote_outcome(self, error: Exception) -> Exception:
+        """Fail the leader with `error`; return what a waiter in the other worker raises."""
+        started = asyncio.Event()
+        fail = asyncio.Event()
+
+        async def work():
+            started.set()
+            await fail.wait()
+            raise error
+
+        async def never():
+            raise AssertionError("the waiter ran the work itself")
+
+        leading = asyncio.create_task(self.leader.do("key", work))
+        await started.wait()
+        waiting = asyncio.create_task(self.other.do("key", never))
+        await asyncio.sleep(0.02)
+        fail.set()
+        with self.assertRaises(type(error)):
+            await leading
+        with self.assertRaises(Exception) as raised:
+            await waiting
+        return raised.exception
+
+    async def test_local_followers_share_the_result(self):
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"after": "refined"}
+
+        results = await asyncio.gather(*(self.leader.do("key", work) for _ in range(3)))
+        self.assertEqual(calls, 1)
+        self.assertEqual(sorted(role for _, role in results), ["leader", "local", "local"])
+
+    async def test_remote_waiter_gets_the_published_result(self):
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return {"after": "refined"}
+
+        leading = asyncio.create_task(self.leader.do("key", work))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(self.other.do("key", work))
+        await asyncio.sleep(0.02)
+        release.set()
+        self.assertEqual(await leading, ({"after": "refined"}, "leader"))
+        self.assertEqual(await waiting, ({"after": "refined"}, "remote"))
+
+    async def test_overrunning_leader_leaves_a_new_holders_lock(self):
+        storage = MemoryStorage()
+        slow = SingleFlight(storage, lock_ttl=0.05, poll_interval=0.01)
+        later = SingleFlight(storage, lock_ttl=5, poll_interval=0.01)
+        release = asyncio.Event()
+
+        async def overrun():
+            await asyncio.sleep(0.1)
+            return {"after": "late"}
+
+        async def hold():
+            await release.wait()
+            return {"after": "held"}
+
+        leading = asyncio.create_task(slow.do("key", overrun))
+        await asyncio.sleep(0.07)  # the lock has expired; another worker takes it
+        holding = asyncio.create_task(later.do("key", hold))
+        await asyncio.sleep(0)
+        await leading
+        await asyncio.gather(*slow._publishing)
+        self.assertEqual(await storage.get("flight:key:lock"), later.owner)
+        release.set()
+        await holding
+
+    async def test_remote_waiter_is_shed_like_the_leader(self):
+        error = await self.remote_outcome(Overloaded("queue_full", 3))
+        self.assertIsInstance(error, Overloaded)
+        self.assertEqual(error.reason, "queue_full")
+        self.assertEqual(error.retry_after, 3)
+
+    async def test_remote_waiter_times_out_like_the_leader(self):
+        error = await self.remote_outcome(DeadlineExceeded("refine"))
+        self.assertIsInstance(error, DeadlineExceeded)
+        self.assertEqual(error.stage, "refine")
+
+    async def test_other_remote_failures_are_coalesced_errors(self):
+        error = await self.remote_outcome(ValueError("bad JSON"))
+        self.assertIsInstance(error, CoalescedError)
+        self.assertEqual(str(error), "bad JSON")
+
+
+if __name__ == "__main__":
+    unittest.main()
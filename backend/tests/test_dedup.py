@@ -0,0 +1,54 @@
+"""
+Tests for dedup.NearDuplicateIndex.
+
+Run from backend/:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import NearDuplicateIndex  # noqa: E402
+
+PARTITION = ("marketing", "en")
+REFINEMENT = {"after": "refined"}
+
+
+def reused(stored: str, query: str, threshold: float = 0.85) -> bool:
+    index = NearDuplicateIndex(threshold=threshold)
+    index.add(stored, PARTITION, REFINEMENT)
+    return index.lookup(query, PARTITION)[0] is not None
+
+
+class NearDuplicateIndexTest(unittest.TestCase):
+    def test_formatting_differences_are_reused(self):
+        self.assertTrue(reused(
+            "Write a launch email for our summer sale, aimed at returning customers.",
+            "write a launch email for our Summer Sale aimed at returning customers",
+        ))
+
+    def test_different_content_words_are_not_reused(self):
+        # Both pairs clear a 0.85 shingle similarity.
+        self.assertFalse(reused(
+            "Write a friendly launch email announcing our summer sale to returning customers, "
+            "with a clear call to action.",
+            "Write a friendly launch email announcing our winter sale to returning customers, "
+            "with a clear call to action.",
+        ))
+
+    def test_different_numbers_are_not_reused(self):
+        self.assertFalse(reused(
+            "Plan a weekly science lesson with hands-on experiments for 10 year olds.",
+            "Plan a weekly science lesson with hands-on experiments for 16 year olds.",
+        ))
+
+    def test_other_partitions_are_not_reused(self):
+        index = NearDuplicateIndex()
+        index.add("Write a launch email for our summer sale.", PARTITION, REFINEMENT)
+        self.assertIsNone(index.lookup("Write a launch email for our summer sale.", ("general", "en"))[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Tests for hedge.HedgePolicy.
+
+Run from backend/:
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hedge import HedgePolicy, LatencyWindow  # noqa: E402
+
+
+def warmed_policy(max_fraction: float) -> HedgePolicy:
+    """A policy that hedges "refine" calls after 10ms."""
+    policy = HedgePolicy(min_delay=0.01, min_samples=1, max_fraction=max_fraction)
+    policy.latencies["refine"] = LatencyWindow()
+    policy.latencies["refine"].record(0.01)
+    return policy
+
+
+class HedgePolicyTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_slow_calls_respect_the_fraction_cap(self):
+        policy = warmed_policy(max_fraction=0.1)
+        attempts = {"primary": 0, "hedge": 0}
+
+        async def attempt(hedge: bool):
+            attempts["hedge" if hedge else "primary"] += 1
+            await asyncio.sleep(0.1)
+            return hedge
+
+        await asyncio.gather(*(policy.run("refine", attempt) for _ in range(100)))
+        self.assertEqual(attempts["primary"], 100)
+        self.assertEqual(attempts["hedge"], 10)
+        self.assertEqual(policy.stats["hedged"], 10)
+
+    async def test_fast_calls_are_not_hedged(self):
+        policy = warmed_policy(max_fraction=1.0)
+
+        async def attempt(hedge: bool):
+            return "hedge" if hedge else "primary"
+
+        result, outcome = await policy.run("refine", attempt)
+        self.assertEqual((result, outcome), ("primary", "unhedged"))
+        self.assertEqual(policy.stats["hedged"], 0)
+
+    async def test_faster_hedge_wins(self):
+        policy = warmed_policy(max_fraction=1.0)
+
+        async def attempt(hedge: bool):
+            await asyncio.sleep(0 if hedge else 0.2)
+            return "hedge" if hedge else "primary"
+
+        result, outcome = await policy.run("refine", attempt)
+        self.assertEqual((result, outcome), ("hedge", "hedge"))
+        self.assertEqual(policy.stats["hedge_wins"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
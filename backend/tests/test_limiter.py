@@ -0,0 +1,79 @@
+"""
+Tests for limiter.AdaptiveLimiter.
+
+Run from backend/:
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limiter import AdaptiveLimiter, Overloaded  # noqa: E402
+
+
+class AdaptiveLimiterTest(unittest.IsolatedAsyncioTestCase):
+    def test_quiet_calls_do_not_raise_the_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=20)
+        limiter.in_flight = 1
+        for _ in range(1000):
+            limiter.record("refine", 0.1, overloaded=False)
+        self.assertEqual(limiter.limit, 20)
+
+    def test_busy_calls_raise_the_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=20)
+        limiter.in_flight = 15
+        for _ in range(20):
+            limiter.record("refine", 0.1, overloaded=False)
+        self.assertGreater(limiter.limit, 20.9)
+        self.assertLess(limiter.limit, 21.1)
+
+    def test_overload_backs_off_once_per_interval(self):
+        limiter = AdaptiveLimiter(initial_limit=20, backoff=0.9)
+        limiter.record("refine", 10.0, overloaded=False)
+        limiter.record("refine", 10.0, overloaded=True)
+        self.assertAlmostEqual(limiter.limit, 18)
+        limiter.record("refine", 10.0, overloaded=True)
+        self.assertAlmostEqual(limiter.limit, 18)
+        self.assertEqual(limiter.stats["decreases"], 1)
+
+    async def test_full_queue_is_shed(self):
+        limiter = AdaptiveLimiter(initial_limit=1, max_queue=0)
+        await limiter.acquire()
+        with self.assertRaises(Overloaded) as raised:
+            await limiter.acquire()
+        self.assertEqual(raised.exception.reason, "queue_full")
+
+    async def test_release_hands_the_slot_to_the_next_waiter(self):
+        limiter = AdaptiveLimiter(initial_limit=1)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.queued, 1)
+        limiter.release()
+        await waiting
+        self.assertEqual(limiter.in_flight, 1)
+        self.assertEqual(limiter.queued, 0)
+
+    async def test_slot_handed_over_as_the_wait_times_out_is_given_back(self):
+        limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=1.0)
+        await limiter.acquire()
+
+        async def times_out_after_handover(waiter, timeout):
+            limiter.release()  # the holder finishes, handing its slot to the waiter
+            self.assertTrue(waiter.done())
+            raise asyncio.TimeoutError
+
+        with mock.patch("asyncio.wait_for", times_out_after_handover):
+            with self.assertRaises(Overloaded) as raised:
+                await limiter.acquire()
+        self.assertEqual(raised.exception.reason, "queue_timeout")
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.queued, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
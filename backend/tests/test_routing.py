@@ -0,0 +1,31 @@
+"""
+Tests for routing.upstream_call.
+
+Run from backend/:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routing import upstream_call  # noqa: E402
+
+
+class UpstreamCallTest(unittest.TestCase):
+    def test_reasoning_model_gets_completion_tokens_and_no_temperature(self):
+        call = upstream_call({"model": "gpt-5.1", "temperature": 0.4, "max_tokens": 200}, 2048)
+        self.assertEqual(call, {"model": "gpt-5.1", "max_completion_tokens": 2248})
+
+    def test_reasoning_model_without_max_tokens_drops_temperature(self):
+        call = upstream_call({"model": "o3-mini", "temperature": 0.0, "messages": []}, 2048)
+        self.assertEqual(call, {"model": "o3-mini", "messages": []})
+
+    def test_other_models_are_unchanged(self):
+        kwargs = {"model": "gpt-4o-mini", "temperature": 0.6, "max_tokens": 200}
+        self.assertEqual(upstream_call(kwargs, 2048), kwargs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Tests for streaming.JSONStringFieldStream.
+
+Run from backend/:
+    python -m unittest discover tests
+"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import JSONStringFieldStream  # noqa: E402
+
+ANSWER = {
+    "before": "write an email",
+    "meta": {"after": "not this one"},
+    "after": 'Line one\nSay "hi" \\ café \U0001F600 / done',
+    "why": "Added structure.",
+}
+
+
+def stream_field(text: str, chunk_size: int) -> str:
+    parser = JSONStringFieldStream("after")
+    return "".join(parser.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size))
+
+
+class JSONStringFieldStreamTest(unittest.TestCase):
+    def test_field_survives_any_chunk_split(self):
+        # ensure_ascii escapes every non-ASCII character, including a surrogate pair.
+        text = json.dumps(ANSWER, ensure_ascii=True)
+        for chunk_size in range(1, 12):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(stream_field(text, chunk_size), ANSWER["after"])
+
+    def test_unescaped_non_ascii_passes_through(self):
+        text = json.dumps(ANSWER, ensure_ascii=False)
+        self.assertEqual(stream_field(text, 3), ANSWER["after"])
+
+    def test_done_once_the_field_closes(self):
+        parser = JSONStringFieldStream("after")
+        self.assertEqual(parser.feed('{"after": "ab'), "ab")
+        self.assertFalse(parser.done)
+        self.assertEqual(parser.feed('c", "why": "x"}'), "c")
+        self.assertTrue(parser.done)
+
+
+if __name__ == "__main__":
+    unittest.main()
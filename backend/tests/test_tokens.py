@@ -0,0 +1,35 @@
+"""
+Tests for the refine output budget in main.OUTPUT_BUDGETS.
+
+Run from backend/:
+    python -m unittest discover tests
+"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["STORAGE_BACKEND"] = "memory"
+
+import main  # noqa: E402
+import tokens  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "refine_response.json")
+
+# The estimate is within about 15% of the real count, and responses vary in length.
+HEADROOM = 1.5
+
+
+class RefineBudgetTest(unittest.TestCase):
+    def test_short_prompt_budget_covers_a_full_refinement(self):
+        with open(FIXTURE, encoding="utf-8") as f:
+            response = json.load(f)
+        needed = tokens.estimate(json.dumps(response, ensure_ascii=False))
+        budget = main.OUTPUT_BUDGETS["refine"].max_tokens(tokens.estimate(response["before"]))
+        self.assertGreaterEqual(budget, needed * HEADROOM)
+
+
+if __name__ == "__main__":
+    unittest.main()
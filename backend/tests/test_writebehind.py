@@ -0,0 +1,69 @@
+"""
+Tests for writebehind.CounterBuffer.
+
+Run from backend/:
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from writebehind import CounterBuffer  # noqa: E402
+
+
+class GatedStorage:
+    """Counters in a dict; `mget` can be held after it has read its values."""
+
+    def __init__(self, values: dict[str, int]):
+        self.values = dict(values)
+        self.mget_started = asyncio.Event()
+        self.mget_release = asyncio.Event()
+        self.mget_release.set()
+
+    async def mget(self, *keys: str) -> list[int | None]:
+        snapshot = [self.values.get(k) for k in keys]
+        self.mget_started.set()
+        await self.mget_release.wait()
+        return snapshot
+
+    async def incrby_many(self, increments: dict[str, int]) -> list[int]:
+        for key, amount in increments.items():
+            self.values[key] = self.values.get(key, 0) + amount
+        return [self.values[k] for k in increments]
+
+
+class CounterBufferTest(unittest.IsolatedAsyncioTestCase):
+    async def test_read_counts_pending_increments(self):
+        buffer = CounterBuffer(GatedStorage({"total": 10}), flush_interval=60)
+        buffer.add({"total": 2})
+        self.assertEqual(await buffer.read("total"), [12])
+        await buffer.flush()
+        self.assertEqual(await buffer.read("total"), [12])
+
+    async def test_flush_during_refresh_is_not_overwritten(self):
+        storage = GatedStorage({"total": 10})
+        buffer = CounterBuffer(storage, flush_interval=60)
+        self.assertEqual(await buffer.read("total"), [10])
+        buffer.add({"total": 1})
+
+        # A refresh reads the old total, then a flush lands before it returns.
+        buffer.known_at = 0.0
+        storage.mget_started.clear()
+        storage.mget_release.clear()
+        read = asyncio.create_task(buffer.read("total"))
+        await storage.mget_started.wait()
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0)
+        storage.mget_release.set()
+        results = await asyncio.gather(read, flush)
+
+        self.assertEqual(results[0], [11])
+        self.assertEqual(storage.values["total"], 11)
+        self.assertEqual(await buffer.read("total"), [11])
+
+
+if __name__ == "__main__":
+    unittest.main()
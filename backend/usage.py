@@ -0,0 +1,60 @@
+"""
+Token usage accounting for completions.
+
+Every call records the provider-reported prompt, completion and cached
+prompt tokens together with its latency, aggregated per call site and per
+category. Comparing `cached_ratio` and the latency of calls with and
+without a prefix-cache hit shows whether prompt caching is paying off.
+"""
+
+
+def usage_counts(usage) -> tuple[int, int, int]:
+    """(prompt, completion, cached prompt) tokens from an OpenAI usage object."""
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0, cached
+
+
+def empty_totals() -> dict:
+    return {"calls": 0, "calls_with_usage": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+            "cache_hit_calls": 0, "latency_cached": 0.0, "latency_uncached": 0.0}
+
+
+class UsageTracker:
+    def __init__(self):
+        self._by_call_site: dict[str, dict] = {}
+        self._by_category: dict[str, dict] = {}
+
+    def record(self, call_site: str, category: str | None, usage, latency: float):
+        prompt, completion, cached = usage_counts(usage)
+        for table, key in ((self._by_call_site, call_site), (self._by_category, category or "none")):
+            totals = table.setdefault(key, empty_totals())
+            totals["calls"] += 1
+            totals["calls_with_usage"] += usage is not None
+            totals["prompt_tokens"] += prompt
+            totals["completion_tokens"] += completion
+            totals["cached_tokens"] += cached
+            if cached:
+                totals["cache_hit_calls"] += 1
+                totals["latency_cached"] += latency
+            else:
+                totals["latency_uncached"] += latency
+
+    @staticmethod
+    def _summary(totals: dict) -> dict:
+        hits = totals["cache_hit_calls"]
+        misses = totals["calls"] - hits
+        return {
+            **{k: v for k, v in totals.items() if not k.startswith("latency_")},
+            "cached_ratio": round(totals["cached_tokens"] / totals["prompt_tokens"], 3) if totals["prompt_tokens"] else 0.0,
+            "avg_latency_ms_cached": round(totals["latency_cached"] / hits * 1000, 1) if hits else None,
+            "avg_latency_ms_uncached": round(totals["latency_uncached"] / misses * 1000, 1) if misses else None,
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            "by_call_site": {k: self._summary(v) for k, v in self._by_call_site.items()},
+            "by_category": {k: self._summary(v) for k, v in self._by_category.items()},
+        }
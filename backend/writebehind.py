@@ -0,0 +1,143 @@
+"""
+Write-behind buffering for counter increments.
+
+`CounterBuffer.add` folds increments into an in-process pending map and
+returns at once. The map is flushed as a single `incrby_many` transaction
+when `max_pending` additions have built up, every `flush_interval` seconds,
+and on close. Increments to the same key are summed first, so a burst of
+ratings costs one command per distinct key instead of one per rating.
+
+`read` serves hot keys (the global totals) from memory: the totals storage
+returned at the last flush, which include other workers' increments up to
+then, refreshed with one `mget` once they are older than `flush_interval`,
+plus this worker's pending increments. `read_fresh` always asks storage and
+adds the pending increments, for keys not worth keeping in memory.
+Consistency bounds for `read`:
+
+- This worker's own increments are always visible to its reads.
+- Other workers' increments appear after they flush and this worker flushes
+  or refreshes after them: within about two flush intervals.
+- Pending increments reach storage within `flush_interval` (sooner under
+  load). Up to that many seconds of increments are lost if the process dies
+  without a clean shutdown; a failed flush keeps its increments for the next
+  attempt.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    def __init__(self, storage, flush_interval: float = 1.0, max_pending: int = 100):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: dict[str, int] = {}
+        self.pending_adds = 0
+        # The batch being written, still counted by reads until its totals are known.
+        self.flushing: dict[str, int] = {}
+        # Totals of the keys read through `read`, as of the last flush or refresh.
+        self.known: dict[str, int] = {}
+        self.known_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._flush_soon: asyncio.Task | None = None
+        self.stats = {"adds": 0, "flushes": 0, "flushed_adds": 0, "commands": 0, "flush_errors": 0, "refreshes": 0}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Write-behind flush failed, will retry: {str(e)}")
+
+    def add(self, increments: dict[str, int]):
+        for key, amount in increments.items():
+            self.pending[key] = self.pending.get(key, 0) + amount
+        self.pending_adds += 1
+        self.stats["adds"] += 1
+        if self.pending_adds >= self.max_pending and (self._flush_soon is None or self._flush_soon.done()):
+            self._flush_soon = asyncio.create_task(self._flush_quietly())
+
+    async def _flush_quietly(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Write-behind flush failed, will retry: {str(e)}")
+
+    async def flush(self):
+        """Write every pending increment in one transaction."""
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, adds = self.pending, self.pending_adds
+            self.pending, self.pending_adds = {}, 0
+            self.flushing = batch
+            try:
+                totals = await self.storage.incrby_many(batch)
+            except Exception:
+                # Put the batch back in front of anything added meanwhile.
+                for key, amount in batch.items():
+                    self.pending[key] = self.pending.get(key, 0) + amount
+                self.pending_adds += adds
+                self.stats["flush_errors"] += 1
+                raise
+            finally:
+                self.flushing = {}
+            for key, total in zip(batch, totals):
+                if key in self.known:
+                    self.known[key] = total
+            if self.known and self.known.keys() <= batch.keys():
+                self.known_at = time.monotonic()
+            self.stats["flushes"] += 1
+            self.stats["flushed_adds"] += adds
+            self.stats["commands"] += len(batch)
+
+    def _to_fetch(self, keys: tuple[str, ...]) -> list[str]:
+        if time.monotonic() - self.known_at > self.flush_interval:
+            return list(dict.fromkeys([*self.known, *keys]))
+        return [k for k in keys if k not in self.known]
+
+    async def read(self, *keys: str) -> list[int]:
+        """Totals kept in memory (at most `flush_interval` old) plus pending increments."""
+        if self._to_fetch(keys):
+            # Refreshes hold the flush lock: totals fetched before a flush
+            # landed would otherwise overwrite the newer ones it stored, with
+            # its batch no longer counted as unflushed.
+            async with self._lock:
+                fetch = self._to_fetch(keys)
+                if fetch:
+                    values = await self.storage.mget(*fetch)
+                    self.known.update((k, int(v or 0)) for k, v in zip(fetch, values))
+                    if self.known.keys() <= set(fetch):
+                        self.known_at = time.monotonic()
+                    self.stats["refreshes"] += 1
+        return [self.known[k] + self.unflushed(k) for k in keys]
+
+    def unflushed(self, key: str) -> int:
+        return self.pending.get(key, 0) + self.flushing.get(key, 0)
+
+    async def read_fresh(self, *keys: str) -> list[int]:
+        """Stored totals plus pending increments."""
+        values = await self.storage.mget(*keys)
+        return [int(v or 0) + self.unflushed(k) for k, v in zip(keys, values)]
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "pending_adds": self.pending_adds,
+            "pending_keys": len(self.pending),
+        }
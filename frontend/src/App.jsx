@@ -212,6 +212,21 @@ if (checkEasterEgg(trimmed)) return;
 
   setRes(response.data);
 
+  // Context questions may still be generating; fetch them in the background
+  if (!response.data.context_questions) {
+    const promptId = response.data.prompt_id;
+    axios
+      .get(`${API_URL}/refine/${promptId}/questions`)
+      .then(({ data }) =>
+        setRes((prev) =>
+          prev?.prompt_id === promptId
+            ? { ...prev, context_questions: data.context_questions }
+            : prev
+        )
+      )
+      .catch((err) => console.error("Context questions failed:", err));
+  }
+
   // Clean the model name, remove date suffix like "-2025-11-13"
   const rawModel = response.data.model || "ChatGPT";
   const cleanModel = rawModel.replace(/-\d{4}-\d{2}-\d{2}$/, "");